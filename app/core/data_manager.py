@@ -1,17 +1,297 @@
+import glob
 import json
 import os
-from typing import Any, Dict
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.core.durable_writer import Files, atomic_write, write_files
+from app.core.snapshot import (
+    SnapshotFormatError,
+    encode_snapshot,
+    load_snapshot,
+    scan_channels,
+)
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None
 
 DATA_FILE = "gamesets.json"
+SNAPSHOT_FILE = "gamesets.snapshot"
+SEASONS_FILE = "seasons.json"
+# サーバーのメンバーごとの現在の名前 (検証ツールが名前で記録されたデータを
+# ボットと同じキーで集計するために使う)
+MEMBERS_FILE = "members.json"
+
+# 保存形式: "json" (従来どおり), "snapshot" (バイナリスナップショットのみ),
+# "both" (両方に保存し、読み込みはスナップショットを優先)
+STORAGE_FORMAT = os.getenv("MJ_STORAGE_FORMAT", "json")
+STORAGE_FORMATS = ("json", "snapshot", "both")
+
+# 保存に使うコーデック: "json" (インデント付き), "json-compact", "orjson", "msgpack"
+# 読み込み時はファイルの内容からコーデックを判別する
+CODEC = os.getenv("MJ_CODEC", "json")
+
+# 保存の確定方法: "sync" (保存ごとに書き出して fsync する),
+# "group" (同時期の保存をまとめて1回の fsync で確定し、コマンドは確定を待ってから応答する),
+# "delayed" (まとめて書き出すが確定を待たない。異常終了時は最大 MJ_COMMIT_DELAY_MS 分の更新を失う)
+DURABILITY = os.getenv("MJ_DURABILITY", "sync")
+DURABILITY_MODES = ("sync", "group", "delayed")
+# group / delayed で保存要求をまとめるために待つ時間 (ミリ秒)
+COMMIT_DELAY_MS = float(os.getenv("MJ_COMMIT_DELAY_MS", "10"))
+
+
+def _materialize(obj: Any) -> Dict[str, Any]:
+    # スナップショットから遅延復元されるマッピングを書き出せるようにする。
+    # 書き出すために復元したチャンネルは保持しない
+    if isinstance(obj, Mapping):
+        return dict(scan_channels(obj))
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class Codec(ABC):
+    """保存するデータとバイト列を相互に変換する"""
+
+    name = ""
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        """データをバイト列に変換する"""
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        """encode したバイト列からデータを復元する"""
+
+
+class JsonCodec(Codec):
+    def __init__(self, name: str, indent: Optional[int]) -> None:
+        self.name = name
+        self.indent = indent
+        self.separators = None if indent else (",", ":")
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            indent=self.indent,
+            separators=self.separators,
+            default=_materialize,
+        ).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+
+    def encode(self, obj: Any) -> bytes:
+        # ユーザーIDをキーにしたプレイヤーのスコアを書き出せるようにする
+        return orjson.dumps(obj, default=_materialize, option=orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=_materialize, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+CODECS: Dict[str, Codec] = {
+    "json": JsonCodec("json", 4),
+    "json-compact": JsonCodec("json-compact", None),
+}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+_LEADING_WHITESPACE = re.compile(rb"\s*")
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    name = name or CODEC
+    if name not in CODECS:
+        raise ValueError(f"Unknown or unavailable codec: {name}")
+    return CODECS[name]
+
+
+def validate_settings() -> None:
+    """環境変数で指定された保存の設定を確認する
+
+    不正な値や、インストールされていないコーデックが指定されている場合は、
+    最初の保存まで待たずに ValueError を送出する。
+    """
+    if STORAGE_FORMAT not in STORAGE_FORMATS:
+        raise ValueError(
+            f"MJ_STORAGE_FORMAT must be one of {STORAGE_FORMATS}: {STORAGE_FORMAT}"
+        )
+    if DURABILITY not in DURABILITY_MODES:
+        raise ValueError(
+            f"MJ_DURABILITY must be one of {DURABILITY_MODES}: {DURABILITY}"
+        )
+    get_codec()
+
+
+validate_settings()
+
+
+def detect_codec(data: bytes) -> Codec:
+    """データの先頭から、JSON か MessagePack かを判別する"""
+    start = _LEADING_WHITESPACE.match(data).end()  # type: ignore
+    if data[start : start + 1] in (b"{", b"[", b""):
+        # JSON はどの書式で保存されていても、利用できる最速の実装で読み込む
+        return CODECS.get("orjson", CODECS["json"])
+    if "msgpack" not in CODECS:  # pragma: no cover
+        raise ValueError("MessagePack data requires the msgpack package")
+    return CODECS["msgpack"]
+
+
+def decode_data(data: bytes) -> Any:
+    return detect_codec(data).decode(data)
+
+
+def _snapshot_codec() -> Codec:
+    # スナップショットはチャンネルごとに保存するため、インデントは付けない
+    codec = get_codec()
+    return CODECS["json-compact"] if codec.name == "json" else codec
+
+
+def _write_data(gamesets: Dict[str, Any], path: str) -> None:
+    atomic_write(path, [get_codec().encode(gamesets)])
+
+
+def _read_data(path: str) -> Any:
+    with open(path, "rb") as f:
+        return decode_data(f.read())
+
+
+def _use_snapshot() -> bool:
+    if STORAGE_FORMAT == "json" or not os.path.exists(SNAPSHOT_FILE):
+        return False
+    if STORAGE_FORMAT == "snapshot" or not os.path.exists(DATA_FILE):
+        return True
+    return os.path.getmtime(SNAPSHOT_FILE) >= os.path.getmtime(DATA_FILE)
 
 
 def load_gamesets() -> Dict[str, Any]:
+    if _use_snapshot():
+        try:
+            return load_snapshot(SNAPSHOT_FILE, decode_data)
+        except SnapshotFormatError:
+            if STORAGE_FORMAT == "snapshot" or not os.path.exists(DATA_FILE):
+                raise
     if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _read_data(DATA_FILE)
     return {}
 
 
+def encode_gamesets(gamesets: Dict[str, Any]) -> Files:
+    """保存形式に応じて、書き出すファイルとその内容を返す"""
+    files: Files = []
+    if STORAGE_FORMAT != "snapshot":
+        files.append((DATA_FILE, [get_codec().encode(gamesets)]))
+    if STORAGE_FORMAT != "json":
+        files.append(
+            (SNAPSHOT_FILE, encode_snapshot(gamesets, _snapshot_codec().encode))
+        )
+    return files
+
+
 def save_gamesets(gamesets: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(gamesets, f, ensure_ascii=False, indent=4)
+    write_files(encode_gamesets(gamesets))
+
+
+def archive_gamesets(gamesets: Dict[str, Any]) -> str:
+    """現在の状態を gamesets.YYYYMMDDHHMMSS.json にアーカイブする
+
+    現在の状態のファイルは変更しない。終了したゲームセットを空にした状態は、
+    呼び出し側が続けて save_gamesets で書き戻す。
+    """
+    base, ext = os.path.splitext(DATA_FILE)
+    archived_at = datetime.now()
+    archive_file = f"{base}.{archived_at.strftime('%Y%m%d%H%M%S')}{ext}"
+    # 同じ秒に複数回アーカイブされても上書きしないよう、空いている時刻までずらす
+    while os.path.exists(archive_file):
+        archived_at += timedelta(seconds=1)
+        archive_file = f"{base}.{archived_at.strftime('%Y%m%d%H%M%S')}{ext}"
+    # 保存形式に関わらず、アーカイブは1つのファイルとして書き出す
+    _write_data(gamesets, archive_file)
+    return archive_file
+
+
+def _is_newer(path: str, than: str) -> bool:
+    return os.stat(path).st_mtime_ns > os.stat(than).st_mtime_ns
+
+
+def find_unfinished_archive() -> Optional[str]:
+    """現在の状態より後に書き出されたアーカイブを返す
+
+    アーカイブを作成した後、現在の状態を書き戻す前にプロセスが終了した場合に見つかる。
+    """
+    paths = list_archive_files()
+    live_file = SNAPSHOT_FILE if _use_snapshot() else DATA_FILE
+    if paths and os.path.exists(live_file) and _is_newer(paths[-1], live_file):
+        return paths[-1]
+    return None
+
+
+def seasons_saved_after(archive_file: str) -> bool:
+    # アーカイブに含まれるゲームセットが、すでにシーズンに集計されているか
+    return os.path.exists(SEASONS_FILE) and not _is_newer(archive_file, SEASONS_FILE)
+
+
+def list_archive_files() -> List[str]:
+    # gamesets.json -> gamesets.YYYYMMDDHHMMSS.json の形式でアーカイブされる
+    base, ext = os.path.splitext(DATA_FILE)
+    pattern = f"{glob.escape(base)}.{'[0-9]' * 14}{ext}"
+    return sorted(glob.glob(pattern))
+
+
+def load_archive(path: str) -> Dict[str, Any]:
+    return _read_data(path)
+
+
+def load_seasons() -> Dict[str, Any]:
+    if os.path.exists(SEASONS_FILE):
+        return _read_data(SEASONS_FILE)
+    return {}
+
+
+def save_seasons(seasons: Dict[str, Any]) -> None:
+    _write_data(seasons, SEASONS_FILE)
+
+
+def load_members() -> Dict[str, Dict[int, List[str]]]:
+    """メンバーの名前 { guild_id: { ユーザーID: [名前, ...] } } を読み込む"""
+    if not os.path.exists(MEMBERS_FILE):
+        return {}
+    members: Dict[str, Dict[int, List[str]]] = {}
+    for guild_id, guild_members in _read_data(MEMBERS_FILE).items():
+        names = members[guild_id] = {}
+        for key, value in guild_members.items():
+            if isinstance(value, int):
+                # 以前の形式 { 名前: ユーザーID } で保存されたファイル
+                names.setdefault(value, []).append(key)
+            else:
+                names[int(key)] = value
+    return members
+
+
+def save_members(members: Dict[str, Dict[int, List[str]]]) -> None:
+    _write_data(members, MEMBERS_FILE)
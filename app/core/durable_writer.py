@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# 書き出すファイルと、その内容 [(パス, [バイト列, ...]), ...]
+Files = List[Tuple[str, Iterable[bytes]]]
+
+
+def _fsync_directory(path: str) -> None:
+    # リネームを確実に永続化するため、ディレクトリも fsync する
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:  # pragma: no cover
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # pragma: no cover
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, chunks: Iterable[bytes]) -> None:
+    """一時ファイルに書き出して fsync した後、置き換える
+
+    書き込みの途中でプロセスが終了しても、元のファイルは壊れない。
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(path)
+
+
+def write_files(files: Files) -> None:
+    for path, chunks in files:
+        atomic_write(path, chunks)
+
+
+class GroupCommitWriter:
+    """保存要求をまとめて1回の書き込みと fsync で確定するライター
+
+    request() で保存を要求すると、バックグラウンドのスレッドが delay 秒待って
+    その間に届いた要求をまとめ、encode() が返す最新の状態を書き出す。
+    wait() を呼ぶと、その要求が永続化されるまで待つことができる。
+    """
+
+    def __init__(
+        self, encode: Callable[[], Files], delay: float, history: int = 1000
+    ) -> None:
+        self._encode = encode
+        self._delay = delay
+        self._condition = threading.Condition()
+        # 書き込み中のファイルを他の処理 (アーカイブなど) と同時に操作しないためのロック
+        self._io_lock = threading.Lock()
+        self._requested = 0
+        self._committed = 0
+        # 書き込みに失敗した要求の番号と、そのエラー
+        self._failed = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self.batch_sizes: Deque[int] = deque(maxlen=history)
+        self.fsync_seconds: Deque[float] = deque(maxlen=history)
+        self._thread = threading.Thread(
+            target=self._run, name="mj-group-commit", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def requested(self) -> int:
+        return self._requested
+
+    def request(self) -> int:
+        with self._condition:
+            self._requested += 1
+            self._condition.notify_all()
+            return self._requested
+
+    def wait(self, ticket: int, timeout: Optional[float] = None) -> None:
+        """ticket までの保存要求が永続化されるまで待つ"""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._committed >= ticket or self._failed >= ticket,
+                timeout,
+            ):
+                raise TimeoutError(f"commit {ticket} did not finish in time")
+            if self._committed < ticket and self._error is not None:
+                raise self._error
+
+    def _write(self, target: int, files: Files) -> None:
+        # self._io_lock を取得した状態で呼び出す
+        started = time.perf_counter()
+        write_files(files)
+        self._committed_through(target, time.perf_counter() - started)
+
+    def _committed_through(self, target: int, elapsed: float) -> None:
+        with self._condition:
+            batch_size = target - self._committed
+            self._committed = target
+            self.batch_sizes.append(batch_size)
+            self.fsync_seconds.append(elapsed)
+            self._condition.notify_all()
+        logger.debug("committed %d requests in %.1f ms", batch_size, elapsed * 1000)
+
+    def commit_now(self, write: Callable[[], T]) -> T:
+        """保留中の保存要求を、呼び出したスレッドで write を実行して確定する
+
+        write は現在の状態全体を書き出す処理 (アーカイブと書き戻しなど) で、
+        バックグラウンドの書き込みと同時に実行されることはない。
+        """
+        with self._io_lock:
+            target = self._requested
+            started = time.perf_counter()
+            result = write()
+            self._committed_through(target, time.perf_counter() - started)
+            return result
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._requested > self._committed or self._closed
+                )
+                if self._closed and self._requested <= self._committed:
+                    return
+            # 同時に届く保存要求をまとめるため、少し待ってから書き出す
+            time.sleep(self._delay)
+            target = self._requested
+            try:
+                files = self._encode()
+                with self._io_lock:
+                    # commit_now で新しい状態が書き出し済みの場合は、古い状態で上書きしない
+                    if target > self._committed:
+                        self._write(target, files)
+            except Exception as e:
+                logger.exception("failed to commit gamesets")
+                with self._condition:
+                    self._failed = target
+                    self._error = e
+                    self._condition.notify_all()
+                    if self._closed:
+                        return
+                time.sleep(max(self._delay, 0.1))
+
+    def close(self) -> None:
+        """未保存の要求を書き出してからスレッドを停止する"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        logger.info("group commit stats: %s", self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        batch_sizes = list(self.batch_sizes)
+        fsync_seconds = list(self.fsync_seconds)
+        return {
+            "commits": len(batch_sizes),
+            "requests": sum(batch_sizes),
+            "max_batch_size": max(batch_sizes, default=0),
+            "avg_batch_size": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0,
+            "max_fsync_ms": max(fsync_seconds, default=0) * 1000,
+            "avg_fsync_ms": (
+                sum(fsync_seconds) / len(fsync_seconds) * 1000 if fsync_seconds else 0
+            ),
+        }
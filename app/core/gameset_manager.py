@@ -1,37 +1,715 @@
-import os
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import functools
+import threading
+import time
+from datetime import date
+from itertools import chain
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+from app.core.data_manager import (
+    COMMIT_DELAY_MS,
+    DURABILITY,
+    DURABILITY_MODES,
+    archive_gamesets,
+    encode_gamesets,
+    find_unfinished_archive,
+    list_archive_files,
+    load_archive,
+    load_gamesets,
+    load_members,
+    load_seasons,
+    save_gamesets,
+    save_members,
+    save_seasons,
+    seasons_saved_after,
+)
+from app.core.durable_writer import Files, GroupCommitWriter
+from app.core.player_index import PlayerNameIndex
+from app.core.players import (
+    PlayerKey,
+    format_player,
+    name_owners,
+    normalize_gameset_players,
+    parse_player,
+    unique_member_ids,
+)
+from app.core.scores import parse_scores
+from app.core.season import (
+    Season,
+    SeasonRow,
+    SeasonStandings,
+    aggregate_archive,
+    parse_channels,
+    rebuild_from_archives,
+)
+from app.core.snapshot import LazyChannels, mark_dirty, scan_channels
+from app.core.tournament import TournamentStandings
+
+# register_members に渡すメンバー: (guild_id, ユーザーID, 表示名, その他の名前)
+MemberRegistration = Tuple[str, int, str, Iterable[str]]
+
+# 卓の名前を指定したゲームセットは "チャンネルID#卓の名前" をキーとして保存する
+TABLE_SEPARATOR = "#"
+
+
+def gameset_key(channel_id: str, table: Optional[str] = None) -> str:
+    table = (table or "").strip()
+    return f"{channel_id}{TABLE_SEPARATOR}{table}" if table else channel_id
+
+
+def split_gameset_key(key: str) -> Tuple[str, Optional[str]]:
+    channel_id, _, table = key.partition(TABLE_SEPARATOR)
+    return channel_id, table or None
+
+
+def collect_player_names(gamesets: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """ゲームセットに記録されたプレイヤーを、ギルドごとに集める"""
+    players: Dict[str, Set[str]] = {}
+    for guild_id, channels in gamesets.items():
+        names = players.setdefault(guild_id, set())
+        for _, gameset_data in scan_channels(channels):
+            names.update(str(player) for player in gameset_data.get("members", {}))
+    return players
+
+
+def load_archive_player_names(path: str) -> Dict[str, Set[str]]:
+    # 読み込めないアーカイブは補完候補の作成には使わない
+    try:
+        return collect_player_names(load_archive(path))
+    except (OSError, ValueError):
+        return {}
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def synchronized(method: F) -> F:
+    # 保存用のスレッドが、変更途中の状態を書き出さないようにする
+    @functools.wraps(method)
+    def wrapper(self: "GamesetManager", *args: Any, **kwargs: Any) -> Any:
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return cast(F, wrapper)
 
-from app.core.data_manager import load_gamesets, save_gamesets
 
-# 現在進行中のゲームセットを管理する辞書
-# { guild_id: { channel_id: { "status": "active", "games": [], "members": {} } } }
-current_gamesets = load_gamesets()
+class GamesetManager:
+    def __init__(self, durability: Optional[str] = None) -> None:
+        # すべてのギルド・チャンネル・卓で共有するロック。保存は現在の状態全体を
+        # 1つのファイルに書き出すが、スナップショットでは変更された卓のみを
+        # エンコードし直す
+        self.lock = threading.RLock()
+        # 現在進行中のゲームセットを管理する辞書
+        # { guild_id: { channel_id: { "status": "active", "games": [], "members": {} } } }
+        # JSON から読み込んだギルドも、卓ごとに変更を追跡する
+        self.current_gamesets: Dict[str, Any] = {
+            guild_id: (
+                channels
+                if isinstance(channels, LazyChannels)
+                else LazyChannels.from_dict(channels)
+            )
+            for guild_id, channels in load_gamesets().items()
+        }
+        # 補完候補のインデックス。過去のプレイヤーは起動後にバックグラウンドで追加する
+        self.player_index = PlayerNameIndex()
+        # サーバーのメンバーごとの現在の名前 { guild_id: { ユーザーID: [名前, ...] } }
+        # 前回の起動時に登録された名前を読み込み、起動後のメンバーの登録で更新する
+        self.members: Dict[str, Dict[int, List[str]]] = load_members()
+        # 名前ごとに、その名前を使っているメンバー { guild_id: { 名前: {ユーザーID, ...} } }
+        self._name_owners: Dict[str, Dict[str, Set[int]]] = {
+            guild_id: name_owners(guild_members)
+            for guild_id, guild_members in self.members.items()
+        }
+        # 名前からユーザーIDへの対応 { guild_id: { 名前: ユーザーID } }
+        # ギルド内で1人のメンバーだけが使っている名前のみを対応させる
+        self.member_ids: Dict[str, Dict[str, int]] = {
+            guild_id: unique_member_ids(owners)
+            for guild_id, owners in self._name_owners.items()
+        }
+        # ユーザーIDごとの表示名のキャッシュ
+        self.display_names: Dict[int, str] = {}
+        # プレイヤーのキーをユーザーIDに移行済みのゲームセット
+        self._normalized: Set[Tuple[str, str]] = set()
+        # 進行中のゲームセットの最終更新時刻 { (guild_id, channel_id): UNIX時間 }
+        # 最初のアイドル検索時に current_gamesets から作成する
+        self._last_activity: Optional[Dict[Tuple[str, str], float]] = None
+        # チャンネルごとの卓をまとめた順位表 { (guild_id, channel_id): 順位表 }
+        # チャンネルごとに最初に必要になった時点で作成し、以降は差分で更新する
+        self._standings: Dict[Tuple[str, str], TournamentStandings] = {}
+        # ギルドごとのシーズン { guild_id: { シーズン名: Season } }
+        self.seasons: Dict[str, Dict[str, Season]] = {
+            guild_id: {
+                name: Season.from_dict(name, season_data)
+                for name, season_data in seasons.items()
+            }
+            for guild_id, seasons in load_seasons().items()
+        }
+        # 進行中のゲームセットをシーズンに集計済みかどうか
+        self._seasons_live_indexed = False
+        # 終了したがまだアーカイブしていないゲームセット。アイドル状態の自動終了では、
+        # 1回の巡回で閉じたゲームセットをまとめてアーカイブする
+        self._pending_archive: List[Tuple[str, str, Dict[str, Any]]] = []
+        self._pending_seasons_changed = False
+        self._finish_interrupted_archive()
+        # 保存をまとめて確定するライター (sync の場合は使わずに毎回書き出す)
+        self.durability = durability or DURABILITY
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability: {self.durability}")
+        self._writer: Optional[GroupCommitWriter] = None
+        if self.durability != "sync":
+            self._writer = GroupCommitWriter(
+                self._encode_current_gamesets, COMMIT_DELAY_MS / 1000
+            )
+            atexit.register(self._writer.close)
+
+    @synchronized
+    def index_player_names(self, players: Mapping[str, Iterable[str]]) -> None:
+        """collect_player_names で集めたプレイヤーを補完候補に追加する"""
+        for guild_id, names in players.items():
+            member_ids = self.member_ids.get(guild_id)
+            self.player_index.add_many(
+                guild_id,
+                (self._index_entry(parse_player(name, member_ids)) for name in names),
+            )
 
+    @synchronized
+    def current_guild_ids(self) -> List[str]:
+        return list(self.current_gamesets)
 
-class GamesetManager:
-    def __init__(self):
-        self.current_gamesets = load_gamesets()
+    @synchronized
+    def index_current_gamesets(self, guild_ids: Iterable[str]) -> None:
+        self.index_player_names(
+            collect_player_names(
+                {
+                    guild_id: self.current_gamesets[guild_id]
+                    for guild_id in guild_ids
+                    if guild_id in self.current_gamesets
+                }
+            )
+        )
+
+    def _index_entry(self, player: PlayerKey) -> Tuple[str, Optional[str]]:
+        """補完候補に追加する (名前, 入力する文字列) を返す"""
+        if isinstance(player, int):
+            # ユーザーIDは表示名が分かる場合のみ補完候補に追加する (空の名前は追加されない)
+            return self.display_names.get(player, ""), format_player(player)
+        return player, None
+
+    @synchronized
+    def register_member(
+        self, guild_id: str, user_id: int, display_name: str, names: Iterable[str]
+    ) -> None:
+        """サーバーのメンバーを、名前で入力された場合にユーザーIDで記録できるよう登録する"""
+        self.register_members([(guild_id, user_id, display_name, names)])
+
+    @synchronized
+    def register_members(
+        self, members: Iterable[MemberRegistration], replace: bool = False
+    ) -> None:
+        """複数のメンバーを登録し、メンバーの名前が変わった場合は1回だけ保存する
+
+        メンバーの以前の名前は、登録した名前に置き換える。replace=True の場合は、
+        登録したギルドで members に含まれないメンバーの名前を外す。
+        """
+        registered: Dict[str, Dict[int, List[str]]] = {}
+        for guild_id, user_id, display_name, names in members:
+            self.display_names[user_id] = display_name
+            registered.setdefault(guild_id, {})[user_id] = sorted(
+                {display_name, *names} - {""}
+            )
+        members_changed = False
+        for guild_id, guild_registered in registered.items():
+            if replace:
+                for user_id in self.members.get(guild_id, {}):
+                    guild_registered.setdefault(user_id, [])
+            touched: Set[str] = set()
+            for user_id, names in guild_registered.items():
+                touched |= self._set_member_names(guild_id, user_id, names)
+            members_changed = members_changed or bool(touched)
+            # 登録したメンバーの名前は、変わっていなくても補完候補に追加する
+            self._update_member_ids(
+                guild_id, touched, chain.from_iterable(guild_registered.values())
+            )
+        if members_changed:
+            save_members(self.members)
+
+    @synchronized
+    def unregister_member(self, guild_id: str, user_id: int) -> None:
+        """サーバーから抜けたメンバーの名前を外す"""
+        touched = self._set_member_names(guild_id, user_id, [])
+        if touched:
+            self._update_member_ids(guild_id, touched)
+            save_members(self.members)
+
+    def _set_member_names(
+        self, guild_id: str, user_id: int, names: List[str]
+    ) -> Set[str]:
+        """メンバーの名前を置き換え、使っているメンバーが変わった名前を返す"""
+        guild_members = self.members.setdefault(guild_id, {})
+        if guild_members.get(user_id, []) == names:
+            return set()
+        previous = set(guild_members.get(user_id, []))
+        if names:
+            guild_members[user_id] = names
+        else:
+            guild_members.pop(user_id, None)
+        owners = self._name_owners.setdefault(guild_id, {})
+        for name in previous.difference(names):
+            owners[name].discard(user_id)
+            if not owners[name]:
+                del owners[name]
+        for name in set(names) - previous:
+            owners.setdefault(name, set()).add(user_id)
+        return previous.symmetric_difference(names)
+
+    def _update_member_ids(
+        self, guild_id: str, names: Set[str], indexed: Iterable[str] = ()
+    ) -> None:
+        """名前を使っているメンバーに合わせて、対応と補完候補を更新する
+
+        indexed の名前は、対応が変わっていなくても補完候補に追加する。
+        """
+        owners = self._name_owners.get(guild_id, {})
+        member_ids = self.member_ids.setdefault(guild_id, {})
+        changed = False
+        for name in names:
+            user_ids = owners.get(name, set())
+            user_id = next(iter(user_ids)) if len(user_ids) == 1 else None
+            if member_ids.get(name) == user_id:
+                continue
+            changed = True
+            if user_id is None:
+                del member_ids[name]
+            else:
+                member_ids[name] = user_id
+        if changed:
+            self._renormalize_guild(guild_id)
+        # 重複する名前はゲストとして入力する候補にし、誰も使っていない名前は外す
+        self.player_index.add_many(
+            guild_id,
+            (
+                (name, format_player(member_ids[name]) if name in member_ids else None)
+                for name in names.union(indexed)
+                if name in owners
+            ),
+        )
+        self.player_index.discard(
+            guild_id, [name for name in names if name not in owners]
+        )
 
-    def _get_gameset_data(self, guild_id: str, channel_id: str) -> Dict[str, Any]:
+    def _renormalize_guild(self, guild_id: str) -> None:
+        """名前とユーザーIDの対応が変わったギルドのゲームセットを、次に使う時点で移行し直す"""
+        self._normalized = {
+            normalized for normalized in self._normalized if normalized[0] != guild_id
+        }
+        # 移行前のキーで集計した順位表は、次に必要になった時点で作り直す
+        for standings_key in [key for key in self._standings if key[0] == guild_id]:
+            del self._standings[standings_key]
+        if self._seasons_live_indexed:
+            self._seasons_live_indexed = False
+            for seasons in self.seasons.values():
+                for season in seasons.values():
+                    season.live = SeasonStandings()
+
+    def search_player_names(
+        self, guild_id: str, prefix: str, limit: int = 25
+    ) -> List[Tuple[str, str]]:
+        # インデックスは独自のロックで保護されるため、コマンドの実行を待たずに検索できる
+        return self.player_index.search(guild_id, prefix, limit)
+
+    def _mark_dirty(self, guild_id: str, key: str) -> None:
+        # 変更したゲームセットは、次の保存でエンコードし直す
+        mark_dirty(self.current_gamesets.get(guild_id, {}), key)
+
+    def _get_gameset_data(self, guild_id: str, key: str) -> Dict[str, Any]:
         if guild_id not in self.current_gamesets:
-            self.current_gamesets[guild_id] = {}
-        if channel_id not in self.current_gamesets[guild_id]:
-            self.current_gamesets[guild_id][channel_id] = {
+            self.current_gamesets[guild_id] = LazyChannels()
+        if key not in self.current_gamesets[guild_id]:
+            self.current_gamesets[guild_id][key] = {
                 "status": "inactive",
                 "games": [],
                 "members": {},
             }
-        return self.current_gamesets[guild_id][channel_id]
+        gameset_data = self.current_gamesets[guild_id][key]
+        if (guild_id, key) not in self._normalized:
+            # 名前で記録された古いデータは、最初に使う時点でユーザーIDに移行する
+            member_ids = self.member_ids.get(guild_id)
+            if normalize_gameset_players(gameset_data, member_ids):
+                self._mark_dirty(guild_id, key)
+            # メンバーの登録前は名前のまま残るため、登録されるまでは移行済みにしない
+            if member_ids is not None:
+                self._normalized.add((guild_id, key))
+        return gameset_data
+
+    def _table_keys(self, guild_id: str, channel_id: str) -> List[str]:
+        table_prefix = f"{channel_id}{TABLE_SEPARATOR}"
+        return [
+            key
+            for key in self.current_gamesets.get(guild_id, {})
+            if key == channel_id or key.startswith(table_prefix)
+        ]
+
+    def _get_standings(self, guild_id: str, channel_id: str) -> TournamentStandings:
+        standings = self._standings.get((guild_id, channel_id))
+        if standings is None:
+            standings = TournamentStandings()
+            for key in self._table_keys(guild_id, channel_id):
+                gameset_data = self._get_gameset_data(guild_id, key)
+                if gameset_data["status"] == "active":
+                    standings.add_table(gameset_data["members"])
+            self._standings[(guild_id, channel_id)] = standings
+        return standings
+
+    def _remove_from_standings(
+        self, guild_id: str, key: str, gameset_data: Dict[str, Any]
+    ) -> None:
+        # 順位表が未作成の場合は、作成時に現在の状態から集計される
+        standings = self._standings.get((guild_id, split_gameset_key(key)[0]))
+        if standings is not None:
+            standings.remove_table(gameset_data["members"])
+
+    @synchronized
+    def is_active(
+        self, guild_id: str, channel_id: str, table: Optional[str] = None
+    ) -> bool:
+        gamesets = self.current_gamesets.get(guild_id, {})
+        key = gameset_key(channel_id, table)
+        return key in gamesets and gamesets[key]["status"] == "active"
+
+    @synchronized
+    def list_tables(self, guild_id: str, channel_id: str) -> List[str]:
+        """チャンネル内で進行中の、名前付きの卓を返す"""
+        tables = []
+        for key in self._table_keys(guild_id, channel_id):
+            table = split_gameset_key(key)[1]
+            if table and self.current_gamesets[guild_id][key]["status"] == "active":
+                tables.append(table)
+        return sorted(tables)
+
+    def _encode_current_gamesets(self) -> Files:
+        with self.lock:
+            return encode_gamesets(self.current_gamesets)
 
     def _save_current_gamesets(self) -> None:
-        save_gamesets(self.current_gamesets)
+        if self._writer is None:
+            save_gamesets(self.current_gamesets)
+        else:
+            self._writer.request()
+
+    def _unarchived_gamesets(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """終了したまま、保留中の一覧にないゲームセットを返す
+
+        アーカイブを保留している間に異常終了した場合に残る。
+        """
+        pending = {(guild_id, key) for guild_id, key, _ in self._pending_archive}
+        unarchived = []
+        for guild_id, channels in self.current_gamesets.items():
+            for key, gameset_data in scan_channels(channels):
+                if (
+                    gameset_data["status"] != "active"
+                    and gameset_data["games"]
+                    and (guild_id, key) not in pending
+                ):
+                    unarchived.append(
+                        (guild_id, key, self._get_gameset_data(guild_id, key))
+                    )
+        return unarchived
+
+    def _add_to_season_finals(
+        self, guild_id: str, key: str, gameset_data: Dict[str, Any]
+    ) -> bool:
+        # 進行中の集計に含まれていない、終了したゲームセットをシーズンに集計する
+        changed = False
+        for season in self.seasons.get(guild_id, {}).values():
+            for scores in self._season_games(guild_id, key, gameset_data, season):
+                season.final.add_game(scores)
+                changed = True
+        return changed
+
+    def _archive_pending(self) -> Optional[str]:
+        """終了したゲームセットを含む現在の状態をアーカイブし、それらを空にして書き戻す
+
+        書き戻す内容は他のチャンネルや卓で進行中のゲームセットを含む状態全体で、
+        一時ファイルから置き換えるため、途中で終了しても空の状態が残ることはない。
+        """
+        if not self._pending_archive:
+            return None
+        # アーカイブされずに残っていたゲームセットも、このアーカイブに含めて空にする
+        unarchived = self._unarchived_gamesets()
+        ended = self._pending_archive + unarchived
+        seasons_changed = self._pending_seasons_changed
+        for guild_id, key, gameset_data in unarchived:
+            if self._add_to_season_finals(guild_id, key, gameset_data):
+                seasons_changed = True
+
+        def archive_and_write_back() -> str:
+            archive_file = archive_gamesets(self.current_gamesets)
+            # 書き戻しより前に保存し、書き戻す前に終了した場合はアーカイブと
+            # シーズンの保存時刻から、起動時にシーズンへの集計が必要かを判断する
+            if seasons_changed:
+                self._save_seasons()
+            for guild_id, key, gameset_data in ended:
+                gameset_data.update(
+                    {
+                        "status": "inactive",
+                        "games": [],
+                        "members": {},
+                    }
+                )
+                self._mark_dirty(guild_id, key)
+            save_gamesets(self.current_gamesets)
+            return archive_file
 
-    def start_gameset(self, guild_id: str, channel_id: str) -> Tuple[bool, str]:
-        gameset_data = self._get_gameset_data(guild_id, channel_id)
+        if self._writer is None:
+            archive_file = archive_and_write_back()
+        else:
+            # 保留中の保存は書き戻しで確定する。ライターが同時に書き込まないよう、
+            # ライターのロックの中で実行する
+            archive_file = self._writer.commit_now(archive_and_write_back)
+        self._pending_archive = []
+        self._pending_seasons_changed = False
+        return archive_file
+
+    @synchronized
+    def archive_ended_gamesets(self) -> Optional[str]:
+        """close_idle_gamesets(archive=False) で閉じたゲームセットをまとめてアーカイブする"""
+        return self._archive_pending()
+
+    def _finish_interrupted_archive(self) -> None:
+        """アーカイブの作成後、現在の状態を書き戻す前に終了していた場合に書き戻しをやり直す
+
+        アーカイブで終了済みになっているゲームセットのうち、現在の状態に同じゲームが
+        残っているものを空にして、再び終了・アーカイブされないようにする。
+        """
+        archive_file = find_unfinished_archive()
+        if archive_file is None:
+            return
+        try:
+            archived = load_archive(archive_file)
+        except (OSError, ValueError):
+            return
+        finalize = not seasons_saved_after(archive_file)
+        cleared = False
+        seasons_changed = False
+        for guild_id, channels in archived.items():
+            current = self.current_gamesets.get(guild_id, {})
+            for key, archived_data in channels.items():
+                games = archived_data.get("games", [])
+                if archived_data.get("status") == "active" or not games:
+                    continue
+                if key not in current:
+                    continue
+                gameset_data = current[key]
+                # 書き戻し前の状態には、アーカイブ直前の保留中の記録が含まれない場合がある
+                if gameset_data["games"] != games[: len(gameset_data["games"])]:
+                    continue
+                gameset_data.update({"status": "inactive", "games": [], "members": {}})
+                self._mark_dirty(guild_id, key)
+                cleared = True
+                if not finalize:
+                    continue
+                normalize_gameset_players(archived_data, self.member_ids.get(guild_id))
+                if self._add_to_season_finals(guild_id, key, archived_data):
+                    seasons_changed = True
+        if cleared:
+            save_gamesets(self.current_gamesets)
+        if seasons_changed:
+            self._save_seasons()
+
+    def wait_for_commit(self, timeout: Optional[float] = None) -> None:
+        """group の場合、これまでの変更がディスクに確定するまで待つ"""
+        if self._writer is not None and self.durability == "group":
+            self._writer.wait(self._writer.requested, timeout)
+
+    def commit_stats(self) -> Dict[str, Any]:
+        """まとめて確定した保存要求の件数と、書き出しにかかった時間を返す"""
+        return self._writer.stats() if self._writer is not None else {}
+
+    def _touch(self, guild_id: str, key: str, gameset_data: Dict[str, Any]) -> None:
+        gameset_data["updated_at"] = time.time()
+        self._mark_dirty(guild_id, key)
+        if self._last_activity is not None:
+            self._last_activity[(guild_id, key)] = gameset_data["updated_at"]
+
+    def _ensure_activity_indexed(self) -> Dict[Tuple[str, str], float]:
+        if self._last_activity is None:
+            now = time.time()
+            self._last_activity = {}
+            for guild_id, channels in self.current_gamesets.items():
+                for key, gameset_data in scan_channels(channels):
+                    if gameset_data["status"] != "active":
+                        continue
+                    if "updated_at" not in gameset_data:
+                        # 更新時刻のない古いデータは、この時点から計測する
+                        gameset_data = channels[key]
+                        gameset_data.setdefault("updated_at", now)
+                        self._mark_dirty(guild_id, key)
+                    self._last_activity[(guild_id, key)] = gameset_data["updated_at"]
+        return self._last_activity
+
+    def _recorded_at(
+        self, gameset_data: Dict[str, Any], game_data: Dict[str, Any]
+    ) -> float:
+        # 記録時刻のない古いゲームは、ゲームセットの最終更新時刻に記録されたものとする
+        return game_data.setdefault(
+            "recorded_at", gameset_data.get("updated_at", time.time())
+        )
+
+    def _season_games(
+        self, guild_id: str, key: str, gameset_data: Dict[str, Any], season: Season
+    ) -> List[Dict[PlayerKey, int]]:
+        channel_id = split_gameset_key(key)[0]
+        if any("recorded_at" not in game_data for game_data in gameset_data["games"]):
+            # _recorded_at で補った記録時刻も保存する
+            self._mark_dirty(guild_id, key)
+        return [
+            game_data["scores"]
+            for game_data in gameset_data["games"]
+            if season.includes(channel_id, self._recorded_at(gameset_data, game_data))
+        ]
+
+    def _index_season_live(self, guild_id: str, season: Season) -> None:
+        active_keys = [
+            key
+            for key, gameset_data in scan_channels(
+                self.current_gamesets.get(guild_id, {})
+            )
+            if gameset_data["status"] == "active"
+        ]
+        for key in active_keys:
+            gameset_data = self._get_gameset_data(guild_id, key)
+            for scores in self._season_games(guild_id, key, gameset_data, season):
+                season.live.add_game(scores)
+
+    def _ensure_seasons_live_indexed(self) -> None:
+        # 進行中のゲームセットの集計は保存せず、最初に必要になった時点で作成する
+        if self._seasons_live_indexed:
+            return
+        self._seasons_live_indexed = True
+        for guild_id, seasons in self.seasons.items():
+            for season in seasons.values():
+                self._index_season_live(guild_id, season)
+
+    def _discard_from_seasons(
+        self, guild_id: str, key: str, gameset_data: Dict[str, Any], finalize: bool
+    ) -> bool:
+        """ゲームセットのゲームを進行中の集計から外す
+
+        finalize の場合は、終了したゲームセットとしてシーズンの集計に確定する。
+        対象のシーズンがあった場合は True を返す。
+        """
+        seasons = self.seasons.get(guild_id, {})
+        for season in seasons.values():
+            for scores in self._season_games(guild_id, key, gameset_data, season):
+                season.live.remove_game(scores)
+                if finalize:
+                    season.final.add_game(scores)
+        return bool(seasons)
+
+    def _save_seasons(self) -> None:
+        save_seasons(
+            {
+                guild_id: {name: season.to_dict() for name, season in seasons.items()}
+                for guild_id, seasons in self.seasons.items()
+            }
+        )
+
+    def define_season(
+        self,
+        guild_id: str,
+        name: str,
+        start: str,
+        end: str,
+        channels: Optional[str] = None,
+    ) -> Tuple[bool, str]:
+        """シーズンを登録し、アーカイブと進行中のゲームセットから順位表を作り直す
+
+        同じ名前のシーズンがある場合は定義を置き換える。チャンネルを指定しない
+        場合は、ギルド内のすべてのチャンネルを対象とする。
+        """
+        try:
+            start_date = date.fromisoformat(start)
+            end_date = date.fromisoformat(end)
+        except ValueError:
+            return False, "日付は `YYYY-MM-DD` の形式で入力してください。"
+        if start_date > end_date:
+            return False, "終了日には開始日以降の日付を指定してください。"
+
+        season = Season(name, start_date, end_date, parse_channels(channels))
+        with self.lock:
+            # 終了したゲームセットは、アーカイブから集計できるようにしておく
+            self._archive_pending()
+            member_ids = dict(self.member_ids.get(guild_id, {}))
+        paths = list_archive_files()
+        # 集計中も他のコマンドを処理できるよう、ロックを解放した状態でアーカイブを
+        # 並列に集計する。作成済みのアーカイブは変更されない
+        season.final = rebuild_from_archives(paths, guild_id, season, member_ids)
+        with self.lock:
+            # 集計中に終了したゲームセットは、新しく作成されたアーカイブから追加する
+            known_paths = set(paths)
+            for path in list_archive_files():
+                if path not in known_paths:
+                    season.final.merge(
+                        aggregate_archive(path, guild_id, season, member_ids)
+                    )
+                    paths.append(path)
+            self._ensure_seasons_live_indexed()
+            self._index_season_live(guild_id, season)
+            self.seasons.setdefault(guild_id, {})[name] = season
+            self._save_seasons()
+        return (
+            True,
+            f"シーズン「{name}」を登録しました。({len(paths)}件のアーカイブから集計しました)",
+        )
+
+    @synchronized
+    def list_seasons(self, guild_id: str) -> List[str]:
+        return sorted(self.seasons.get(guild_id, {}))
+
+    @synchronized
+    def get_season_standings(
+        self, guild_id: str, name: str
+    ) -> Tuple[bool, str, Optional[List[SeasonRow]]]:
+        season = self.seasons.get(guild_id, {}).get(name)
+        if season is None:
+            return False, f"シーズン「{name}」は登録されていません。", None
+        self._ensure_seasons_live_indexed()
+        ranking = season.ranking()
+        if not ranking:
+            return False, "まだゲームが記録されていません。", None
+        return (
+            True,
+            f"シーズン「{name}」 ({season.start.isoformat()}〜{season.end.isoformat()})",
+            ranking,
+        )
+
+    @synchronized
+    def start_gameset(
+        self, guild_id: str, channel_id: str, table: Optional[str] = None
+    ) -> Tuple[bool, str]:
+        key = gameset_key(channel_id, table)
+        if any(ended[:2] == (guild_id, key) for ended in self._pending_archive):
+            # アーカイブを保留しているゲームセットは、新しく開始する前にアーカイブする
+            self._archive_pending()
+        gameset_data = self._get_gameset_data(guild_id, key)
 
         if gameset_data["status"] == "active":
             # 既存のゲームセットを破棄
+            self._remove_from_standings(guild_id, key, gameset_data)
+            self._ensure_seasons_live_indexed()
+            self._discard_from_seasons(guild_id, key, gameset_data, finalize=False)
             gameset_data.update(
                 {
                     "status": "inactive",
@@ -39,6 +717,7 @@ class GamesetManager:
                     "members": {},
                 }
             )
+            self._mark_dirty(guild_id, key)
             self._save_current_gamesets()
             # 新しいゲームセットを開始
             gameset_data.update(
@@ -48,6 +727,7 @@ class GamesetManager:
                     "members": {},
                 }
             )
+            self._touch(guild_id, key, gameset_data)
             self._save_current_gamesets()
             return (
                 True,
@@ -61,12 +741,14 @@ class GamesetManager:
                     "members": {},
                 }
             )
+            self._touch(guild_id, key, gameset_data)
             self._save_current_gamesets()
             return (
                 True,
                 "麻雀のスコア集計を開始します。",
             )
 
+    @synchronized
     def record_game(
         self,
         guild_id: str,
@@ -75,8 +757,10 @@ class GamesetManager:
         players_count: int,
         scores_str: str,
         service: str,
-    ) -> Tuple[bool, str, Optional[List[Tuple[str, int]]]]:
-        gameset_data = self._get_gameset_data(guild_id, channel_id)
+        table: Optional[str] = None,
+    ) -> Tuple[bool, str, Optional[List[Tuple[PlayerKey, int]]]]:
+        key = gameset_key(channel_id, table)
+        gameset_data = self._get_gameset_data(guild_id, key)
 
         if gameset_data["status"] != "active":
             return (
@@ -85,71 +769,37 @@ class GamesetManager:
                 None,
             )
 
-        expected_players_count = players_count
-
-        parsed_scores = {}
-        total_score = 0
-
-        score_entries = [s.strip() for s in scores_str.split(",")]
-
-        if len(score_entries) != expected_players_count:
-            return (
-                False,
-                f"{expected_players_count}人分のスコアを入力してください。現在 {len(score_entries)}人分のスコアが入力されています。",
-                None,
-            )
-
-        player_names = []
-        for entry in score_entries:
-            try:
-                name, score_str_val = entry.split(":")
-                player_name = name.strip().lstrip("@")  # @を削除
-                score = int(score_str_val)
-
-                if player_name in player_names:
-                    return (
-                        False,
-                        f"プレイヤー名 '{player_name}' が重複しています。異なるプレイヤー名を入力してください。",
-                        None,
-                    )
-                player_names.append(player_name)
-                parsed_scores[player_name] = score
-                total_score += score
-            except ValueError:
-                return (
-                    False,
-                    "スコアの形式が正しくありません。`名前:スコア` の形式で入力してください (例: `@player1:25000`)。",
-                    None,
-                )
-            except IndexError:
-                return (
-                    False,
-                    "スコアの形式が正しくありません。`名前:スコア` の形式で入力してください (例: `@player1:25000`)。",
-                    None,
-                )
-
-        # ゼロサムチェック
-        if total_score != 0:
-            return (
-                False,
-                f"スコアの合計が0になりません。現在の合計: {total_score}。再入力してください。",
-                None,
-            )
+        success, message, parsed_scores = parse_scores(
+            scores_str, players_count, self.member_ids.get(guild_id)
+        )
+        if not success or parsed_scores is None:
+            return False, message, None
 
+        recorded_at = time.time()
         game_data = {
             "rule": rule,
             "players_count": players_count,
             "scores": parsed_scores,
             "service": service,
+            "recorded_at": recorded_at,
         }
+        self._ensure_seasons_live_indexed()
         gameset_data["games"].append(game_data)
+        for season in self.seasons.get(guild_id, {}).values():
+            if season.includes(channel_id, recorded_at):
+                season.live.add_game(parsed_scores)
 
-        # メンバーのスコアを更新
+        # メンバーのスコアと、チャンネル全体の順位表を更新
+        standings = self._get_standings(guild_id, channel_id)
         for player_name, score in parsed_scores.items():
-            if player_name not in gameset_data["members"]:
+            joined_table = player_name not in gameset_data["members"]
+            if joined_table:
                 gameset_data["members"][player_name] = 0
             gameset_data["members"][player_name] += score
+            standings.add_score(player_name, score, joined_table)
+            self.player_index.add(guild_id, *self._index_entry(player_name))
 
+        self._touch(guild_id, key, gameset_data)
         self._save_current_gamesets()
 
         # 順位を計算し、結果を返す
@@ -158,10 +808,11 @@ class GamesetManager:
         )
         return True, "ゲーム結果を記録しました。", sorted_game_scores
 
+    @synchronized
     def get_current_scores(
-        self, guild_id: str, channel_id: str
-    ) -> Tuple[bool, str, Optional[List[Tuple[str, int]]]]:
-        gameset_data = self._get_gameset_data(guild_id, channel_id)
+        self, guild_id: str, channel_id: str, table: Optional[str] = None
+    ) -> Tuple[bool, str, Optional[List[Tuple[PlayerKey, int]]]]:
+        gameset_data = self._get_gameset_data(guild_id, gameset_key(channel_id, table))
 
         if gameset_data["status"] != "active":
             return (
@@ -182,57 +833,112 @@ class GamesetManager:
 
         return True, "現在のトータルスコア", sorted_scores
 
-    def end_gameset(
+    @synchronized
+    def get_standings(
         self, guild_id: str, channel_id: str
-    ) -> Tuple[bool, str, Optional[List[Tuple[str, int]]]]:
-        gameset_data = self._get_gameset_data(guild_id, channel_id)
+    ) -> Tuple[bool, str, Optional[List[Tuple[PlayerKey, int]]]]:
+        """チャンネル内の進行中の全卓を合計した順位を返す"""
+        standings = self._get_standings(guild_id, channel_id)
+        if not standings:
+            return False, "まだゲームが記録されていません。", None
+        return True, "全卓のトータルスコア", standings.ranking()
+
+    def _end_gamesets(
+        self, targets: List[Tuple[str, str]], archive: bool = True
+    ) -> List[Optional[List[Tuple[PlayerKey, int]]]]:
+        """ゲームセットをまとめて閉じ、1度の保存とアーカイブで確定する
+
+        ゲームセットごとに、スコアを降順にソートした結果を返す。
+        記録されたゲームがない場合は None を返す。archive が False の場合は
+        アーカイブを保留し、閉じた状態のみを保存する。
+        """
+        results: List[Optional[List[Tuple[PlayerKey, int]]]] = []
+        # 非アクティブにする前に、進行中のゲームセットをシーズンに集計しておく
+        self._ensure_seasons_live_indexed()
+        for guild_id, key in targets:
+            gameset_data = self._get_gameset_data(guild_id, key)
+            # ゲームセットを非アクティブにし、順位表から外す
+            gameset_data["status"] = "inactive"
+            self._mark_dirty(guild_id, key)
+            self._remove_from_standings(guild_id, key, gameset_data)
+            if self._last_activity is not None:
+                self._last_activity.pop((guild_id, key), None)
+
+            total_scores = gameset_data["members"]
+            if not total_scores:
+                # ゲーム記録がない場合はアーカイブせずに閉じる
+                gameset_data.update({"games": [], "members": {}})
+                results.append(None)
+                continue
+
+            # スコアを降順にソート
+            results.append(
+                sorted(total_scores.items(), key=lambda item: item[1], reverse=True)
+            )
+            self._pending_archive.append((guild_id, key, gameset_data))
+            if self._discard_from_seasons(guild_id, key, gameset_data, finalize=True):
+                self._pending_seasons_changed = True
+
+        if archive and self._pending_archive:
+            self._archive_pending()
+        else:
+            self._save_current_gamesets()
+        return results
+
+    @synchronized
+    def end_gameset(
+        self, guild_id: str, channel_id: str, table: Optional[str] = None
+    ) -> Tuple[bool, str, Optional[List[Tuple[PlayerKey, int]]]]:
+        key = gameset_key(channel_id, table)
+        gameset_data = self._get_gameset_data(guild_id, key)
 
         if gameset_data["status"] != "active":
             return False, "このチャンネルで進行中のゲームセットがありません。", None
 
-        total_scores = gameset_data["members"]
+        sorted_scores = self._end_gamesets([(guild_id, key)])[0]
 
         # ゲーム記録がない場合、メッセージを返さずにゲームセットを閉じる
-        if not total_scores:
-            gameset_data["status"] = "inactive"
-            self._save_current_gamesets()
-            # current_gamesetsもクリアする
-            gameset_data.update(
-                {
-                    "status": "inactive",
-                    "games": [],
-                    "members": {},
-                }
-            )
+        if sorted_scores is None:
             return (
                 True,
                 "ゲームセットを閉じました。記録されたゲームはありませんでした。",
                 None,
             )
 
-        # スコアを降順にソート
-        sorted_scores = sorted(
-            total_scores.items(), key=lambda item: item[1], reverse=True
-        )
-
-        # ゲームセットを非アクティブにする
-        gameset_data["status"] = "inactive"
-        self._save_current_gamesets()
-
-        # ファイルをリネーム
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        new_file_name = f"gamesets.{timestamp}.json"
-        if os.path.exists("gamesets.json"):  # DATA_FILEはdata_managerにあるため直接指定
-            os.rename("gamesets.json", new_file_name)
-            # リネーム後、gamesets.jsonを空にする
-            save_gamesets({})  # data_managerのsave_gamesetsを使用
-            # current_gamesetsもクリアする
-            gameset_data.update(
-                {
-                    "status": "inactive",
-                    "games": [],
-                    "members": {},
-                }
-            )
-
         return True, "麻雀ゲームセット結果", sorted_scores
+
+    @synchronized
+    def find_idle_gamesets(
+        self, ttl_seconds: float, now: Optional[float] = None
+    ) -> List[Tuple[str, str]]:
+        """最終更新から ttl_seconds 以上経過した進行中のゲームセットを古い順に返す"""
+        deadline = (time.time() if now is None else now) - ttl_seconds
+        idle = [
+            (updated_at, key)
+            for key, updated_at in self._ensure_activity_indexed().items()
+            if updated_at <= deadline
+        ]
+        return [key for _, key in sorted(idle)]
+
+    @synchronized
+    def close_idle_gamesets(
+        self,
+        ttl_seconds: float,
+        limit: int,
+        now: Optional[float] = None,
+        archive: bool = True,
+    ) -> List[Tuple[str, str, Optional[List[Tuple[PlayerKey, int]]]]]:
+        """アイドル状態のゲームセットを最大 limit 件、end_gameset と同じ方法で閉じる
+
+        (guild_id, ゲームセットのキー, 結果) を返す。キーは split_gameset_key で
+        チャンネルIDと卓の名前に分割できる。archive が False の場合はアーカイブを
+        保留し、archive_ended_gamesets でまとめてアーカイブする。
+        """
+        targets = self.find_idle_gamesets(ttl_seconds, now)[:limit]
+        if not targets:
+            return []
+        results = self._end_gamesets(targets, archive)
+        return [
+            (guild_id, key, sorted_scores)
+            for (guild_id, key), sorted_scores in zip(targets, results)
+        ]
@@ -0,0 +1,126 @@
+import bisect
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class PlayerNameIndex:
+    """ギルドごとのプレイヤー名の前方一致インデックス
+
+    ソート済み配列を bisect で探索するため、検索は O(log n + 件数) で完了する。
+    名前ごとに、scores に入力する文字列 (メンションまたは名前) を保持する。
+    独自のロックで保護するため、補完はイベントループから直接検索できる。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # { guild_id: [(casefold した名前, 元の名前, 入力する文字列), ...] } をソート済みで保持する
+        self._entries: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._names: Dict[str, Dict[str, str]] = {}
+
+    def add(self, guild_id: str, name: str, token: Optional[str] = None) -> None:
+        if not name:
+            return
+        token = token or name
+        with self._lock:
+            names = self._names.setdefault(guild_id, {})
+            if names.get(name) == token:
+                return
+            entries = self._entries.setdefault(guild_id, [])
+            if name in names:
+                # ゲストとして記録された名前がメンバーの名前になった場合などは置き換える
+                entries.remove((name.casefold(), name, names[name]))
+            names[name] = token
+            bisect.insort(entries, (name.casefold(), name, token))
+
+    def add_many(
+        self, guild_id: str, names: Iterable[Tuple[str, Optional[str]]]
+    ) -> None:
+        """(名前, 入力する文字列) をまとめて追加する
+
+        1件ずつ挿入せず、追加する名前をソートしてから既存の配列とマージする。
+        """
+        with self._lock:
+            known = self._names.setdefault(guild_id, {})
+            changed: Dict[str, str] = {}
+            for name, token in names:
+                if name and known.get(name) != (token or name):
+                    changed[name] = token or name
+            if not changed:
+                return
+            entries = self._entries.get(guild_id, [])
+            replaced = {
+                (name.casefold(), name, known[name])
+                for name in changed
+                if name in known
+            }
+            if replaced:
+                entries = [entry for entry in entries if entry not in replaced]
+            known.update(changed)
+            added = sorted(
+                (name.casefold(), name, token) for name, token in changed.items()
+            )
+            self._entries[guild_id] = list(heapq.merge(entries, added))
+
+    def discard(self, guild_id: str, names: Iterable[str]) -> None:
+        """名前を補完候補から外す"""
+        with self._lock:
+            known = self._names.get(guild_id, {})
+            removed = {
+                (name.casefold(), name, known.pop(name))
+                for name in set(names)
+                if name in known
+            }
+            if removed:
+                self._entries[guild_id] = [
+                    entry for entry in self._entries[guild_id] if entry not in removed
+                ]
+
+    def search(
+        self, guild_id: str, prefix: str, limit: int = 25
+    ) -> List[Tuple[str, str]]:
+        """prefix で始まる (名前, 入力する文字列) を返す"""
+        key = prefix.casefold()
+        results: List[Tuple[str, str]] = []
+        with self._lock:
+            entries = self._entries.get(guild_id)
+            if not entries or limit <= 0:
+                return []
+            for i in range(bisect.bisect_left(entries, (key,)), len(entries)):
+                folded, name, token = entries[i]
+                if not folded.startswith(key) or len(results) >= limit:
+                    break
+                results.append((name, token))
+        return results
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(names) for names in self._names.values())
+
+
+def split_scores_input(current: str) -> Tuple[str, Optional[str]]:
+    """入力途中の scores 文字列を、確定済み部分と補完対象の名前に分割する
+
+    最後のエントリにすでにスコアが入力されている場合、補完対象は None になる。
+    """
+    head, sep, last = current.rpartition(",")
+    if ":" in last:
+        return current, None
+    prefix = f"{head}{sep}" if sep else ""
+    if sep:
+        prefix += " "
+    return prefix, last.strip().lstrip("@")
+
+
+def build_scores_completions(
+    current: str, candidates: List[Tuple[str, str]], max_length: int = 100
+) -> List[Tuple[str, str]]:
+    """補完候補から、(表示する文字列, scores に入力する文字列) の候補を作成する"""
+    head, _ = split_scores_input(current)
+    completions = []
+    for name, token in candidates:
+        label = f"{head}{name}"
+        value = f"{head}{token}:"
+        if len(label) <= max_length and len(value) <= max_length:
+            completions.append((label, value))
+    return completions
@@ -0,0 +1,96 @@
+import re
+from typing import Any, Dict, Iterable, Mapping, Optional, Set, Union
+
+# Discord のユーザーは整数のユーザーID、ゲストは入力された名前で記録する
+PlayerKey = Union[int, str]
+
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+# JSON ではキーが文字列になるため、ユーザーIDと同じ形式の文字列は整数に戻す
+SNOWFLAKE_PATTERN = re.compile(r"\d{15,21}")
+
+
+def parse_player(
+    token: str, member_ids: Optional[Mapping[str, int]] = None
+) -> PlayerKey:
+    """scores の名前部分をプレイヤーのキーに変換する
+
+    メンション (`<@123>`) やユーザーIDはそのユーザーID、サーバーのメンバー名は
+    member_ids で対応するユーザーID、それ以外は @ を除いた名前になる。
+    """
+    token = token.strip()
+    match = MENTION_PATTERN.fullmatch(token)
+    if match:
+        return int(match.group(1))
+    name = token.lstrip("@")
+    return normalize_player(name, member_ids)
+
+
+def normalize_player(
+    player: PlayerKey, member_ids: Optional[Mapping[str, int]] = None
+) -> PlayerKey:
+    if isinstance(player, int):
+        return player
+    if SNOWFLAKE_PATTERN.fullmatch(player):
+        return int(player)
+    return (member_ids or {}).get(player, player)
+
+
+def format_player(player: PlayerKey) -> str:
+    return f"<@{player}>" if isinstance(player, int) else player
+
+
+def name_owners(members: Mapping[int, Iterable[str]]) -> Dict[str, Set[int]]:
+    """{ ユーザーID: [名前, ...] } から、名前ごとにその名前を使っているメンバーを返す"""
+    owners: Dict[str, Set[int]] = {}
+    for user_id, names in members.items():
+        for name in names:
+            owners.setdefault(name, set()).add(user_id)
+    return owners
+
+
+def unique_member_ids(owners: Mapping[str, Set[int]]) -> Dict[str, int]:
+    """名前からユーザーIDへの対応を返す
+
+    複数のメンバーが使っている名前は、どのメンバーか決められないため対応させない
+    (入力された場合はゲストとして記録する)。
+    """
+    return {
+        name: next(iter(user_ids))
+        for name, user_ids in owners.items()
+        if len(user_ids) == 1
+    }
+
+
+def _normalize_scores(
+    scores: Dict[Any, int], member_ids: Optional[Mapping[str, int]]
+) -> Dict[PlayerKey, int]:
+    normalized: Dict[PlayerKey, int] = {}
+    for player, score in scores.items():
+        key = normalize_player(player, member_ids)
+        normalized[key] = normalized.get(key, 0) + score
+    return normalized
+
+
+def normalize_gameset_players(
+    gameset_data: Dict[str, Any], member_ids: Optional[Mapping[str, int]] = None
+) -> bool:
+    """保存されたゲームセットのプレイヤーのキーを、ユーザーIDに移行する
+
+    名前で記録されたプレイヤーのうち、サーバーのメンバー名と一致するものは
+    ユーザーIDにまとめる。変更があった場合は True を返す。
+    """
+    changed = False
+    members = gameset_data.get("members", {})
+    if any(not isinstance(player, int) for player in members):
+        normalized = _normalize_scores(members, member_ids)
+        if list(normalized) != list(members):
+            gameset_data["members"] = normalized
+            changed = True
+    for game_data in gameset_data.get("games", []):
+        scores = game_data["scores"]
+        if any(not isinstance(player, int) for player in scores):
+            normalized = _normalize_scores(scores, member_ids)
+            if list(normalized) != list(scores):
+                game_data["scores"] = normalized
+                changed = True
+    return changed
@@ -0,0 +1,67 @@
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from app.core.players import PlayerKey, format_player, parse_player
+
+FORMAT_ERROR_MESSAGE = "スコアの形式が正しくありません。`名前:スコア` の形式で入力してください (例: `@player1:25000`)。"
+
+
+def players_count_error(players_count: int, actual: int) -> Optional[str]:
+    if actual != players_count:
+        return f"{players_count}人分のスコアを入力してください。現在 {actual}人分のスコアが入力されています。"
+    return None
+
+
+def validate_scores(
+    scores: Mapping[PlayerKey, int], players_count: int
+) -> Optional[str]:
+    """1ゲームのスコアが、人数とゼロサムの条件を満たすか確認する
+
+    条件を満たさない場合はエラーメッセージを返す。記録時と、保存済みのデータの
+    検証の両方で使う。
+    """
+    error = players_count_error(players_count, len(scores))
+    if error:
+        return error
+    # ゼロサムチェック
+    total_score = sum(scores.values())
+    if total_score != 0:
+        return f"スコアの合計が0になりません。現在の合計: {total_score}。再入力してください。"
+    return None
+
+
+def parse_scores(
+    scores_str: str,
+    players_count: int,
+    member_ids: Optional[Mapping[str, int]] = None,
+) -> Tuple[bool, str, Optional[Dict[PlayerKey, int]]]:
+    """`名前:スコア` のカンマ区切りの文字列を、プレイヤーごとのスコアに変換する"""
+    score_entries = [s.strip() for s in scores_str.split(",")]
+
+    error = players_count_error(players_count, len(score_entries))
+    if error:
+        return False, error, None
+
+    parsed_scores: Dict[PlayerKey, int] = {}
+    player_names: List[PlayerKey] = []
+    for entry in score_entries:
+        try:
+            name, score_str_val = entry.split(":")
+            # メンションはユーザーID、それ以外は@を削除した名前にする
+            player_name = parse_player(name, member_ids)
+            score = int(score_str_val)
+        except (ValueError, IndexError):
+            return False, FORMAT_ERROR_MESSAGE, None
+
+        if player_name in player_names:
+            return (
+                False,
+                f"プレイヤー名 '{format_player(player_name)}' が重複しています。異なるプレイヤー名を入力してください。",
+                None,
+            )
+        player_names.append(player_name)
+        parsed_scores[player_name] = score
+
+    error = validate_scores(parsed_scores, players_count)
+    if error:
+        return False, error, None
+    return True, "", parsed_scores
@@ -0,0 +1,228 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from app.core.data_manager import load_archive
+from app.core.players import PlayerKey, normalize_gameset_players, normalize_player
+
+# 記録する着順の数 (3人戦では4着は記録されない)
+PLACEMENTS = 4
+
+# (プレイヤー, 合計ポイント, ゲーム数, [1着の回数, 2着の回数, ...])
+SeasonRow = Tuple[PlayerKey, int, int, List[int]]
+
+_ARCHIVE_TIMESTAMP = re.compile(r"\.(\d{14})\.[^.]+$")
+_CHANNEL_ID = re.compile(r"\d+")
+
+
+def game_placements(scores: Mapping[PlayerKey, int]) -> List[Tuple[PlayerKey, int]]:
+    """(プレイヤー, 着順のインデックス) を返す。同点の場合は記録された順とする"""
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(player, rank) for rank, (player, _) in enumerate(ranked)]
+
+
+def parse_channels(channels: Optional[str]) -> List[str]:
+    """`<#123>, 456` のようなチャンネルの指定から、チャンネルIDを取り出す"""
+    return _CHANNEL_ID.findall(channels or "")
+
+
+def archive_timestamp(path: str) -> Optional[float]:
+    """gamesets.YYYYMMDDHHMMSS.json の形式のファイル名から、アーカイブした時刻を返す"""
+    match = _ARCHIVE_TIMESTAMP.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d%H%M%S").timestamp()
+
+
+class SeasonStandings:
+    """シーズンの順位表
+
+    ゲームの記録やゲームセットの破棄に合わせて差分で更新するため、
+    順位の表示はプレイヤー数に比例する時間で完了する。
+    """
+
+    def __init__(self) -> None:
+        self._points: Dict[PlayerKey, int] = {}
+        self._games: Dict[PlayerKey, int] = {}
+        self._placements: Dict[PlayerKey, List[int]] = {}
+
+    def _apply(self, player: PlayerKey, points: int, games: int, rank: int) -> None:
+        self._points[player] = self._points.get(player, 0) + points
+        self._games[player] = self._games.get(player, 0) + games
+        placements = self._placements.setdefault(player, [0] * PLACEMENTS)
+        placements[rank] += games
+        if self._games[player] == 0:
+            del self._points[player]
+            del self._games[player]
+            del self._placements[player]
+
+    def add_game(self, scores: Mapping[PlayerKey, int]) -> None:
+        for player, rank in game_placements(scores):
+            self._apply(player, scores[player], 1, rank)
+
+    def remove_game(self, scores: Mapping[PlayerKey, int]) -> None:
+        for player, rank in game_placements(scores):
+            self._apply(player, -scores[player], -1, rank)
+
+    def merge(self, other: "SeasonStandings") -> None:
+        for player, points in other._points.items():
+            self._points[player] = self._points.get(player, 0) + points
+            self._games[player] = self._games.get(player, 0) + other._games[player]
+            placements = self._placements.setdefault(player, [0] * PLACEMENTS)
+            for rank, count in enumerate(other._placements[player]):
+                placements[rank] += count
+
+    def rows(self) -> Dict[PlayerKey, Tuple[int, int, List[int]]]:
+        return {
+            player: (points, self._games[player], self._placements[player])
+            for player, points in self._points.items()
+        }
+
+    def to_dict(self) -> Dict[PlayerKey, Dict[str, Any]]:
+        return {
+            player: {"points": points, "games": games, "placements": placements}
+            for player, (points, games, placements) in self.rows().items()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[Any, Mapping[str, Any]]) -> "SeasonStandings":
+        standings = cls()
+        for player, row in data.items():
+            key = normalize_player(player)
+            standings._points[key] = row["points"]
+            standings._games[key] = row["games"]
+            standings._placements[key] = list(row["placements"])
+        return standings
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+
+class Season:
+    """期間と対象のチャンネルを指定したシーズン
+
+    終了したゲームセットの集計 (final) は保存し、進行中のゲームセットの集計
+    (live) は起動後に現在の状態から作成する。
+    """
+
+    def __init__(
+        self, name: str, start: date, end: date, channels: Iterable[str] = ()
+    ) -> None:
+        self.name = name
+        self.start = start
+        self.end = end
+        # 空の場合はギルド内のすべてのチャンネルを対象とする
+        self.channels = sorted(set(channels))
+        self.starts_at = datetime.combine(start, time()).timestamp()
+        self.ends_at = datetime.combine(end + timedelta(days=1), time()).timestamp()
+        self.final = SeasonStandings()
+        self.live = SeasonStandings()
+
+    def includes(self, channel_id: str, recorded_at: float) -> bool:
+        if self.channels and channel_id not in self.channels:
+            return False
+        return self.starts_at <= recorded_at < self.ends_at
+
+    def ranking(self) -> List[SeasonRow]:
+        rows = self.final.rows()
+        for player, (points, games, placements) in self.live.rows().items():
+            if player in rows:
+                total_points, total_games, total_placements = rows[player]
+                rows[player] = (
+                    total_points + points,
+                    total_games + games,
+                    [a + b for a, b in zip(total_placements, placements)],
+                )
+            else:
+                rows[player] = (points, games, placements)
+        return sorted(
+            ((player, *row) for player, row in rows.items()),
+            key=lambda row: row[1],
+            reverse=True,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "channels": self.channels,
+            "standings": self.final.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, name: str, data: Mapping[str, Any]) -> "Season":
+        season = cls(
+            name,
+            date.fromisoformat(data["start"]),
+            date.fromisoformat(data["end"]),
+            data.get("channels", []),
+        )
+        season.final = SeasonStandings.from_dict(data.get("standings", {}))
+        return season
+
+
+def aggregate_archive(
+    path: str,
+    guild_id: str,
+    season: Season,
+    member_ids: Optional[Mapping[str, int]] = None,
+) -> SeasonStandings:
+    """アーカイブ内の終了したゲームセットのうち、シーズンに含まれるゲームを集計する
+
+    ゲームセットを終了した時点のアーカイブでは、そのゲームセットは非アクティブで
+    ゲームが残った状態で保存されている。進行中のゲームセットは、終了した時点の
+    アーカイブで集計されるため数えない。記録時刻のない古いゲームは、アーカイブした
+    時刻に記録されたものとみなす。
+    """
+    standings = SeasonStandings()
+    try:
+        gamesets = load_archive(path)
+    except (OSError, ValueError):
+        return standings
+    archived_at = archive_timestamp(path) or 0.0
+    for key, gameset_data in gamesets.get(guild_id, {}).items():
+        if gameset_data.get("status") == "active" or not gameset_data.get("games"):
+            continue
+        normalize_gameset_players(gameset_data, member_ids)
+        # "チャンネルID#卓の名前" の形式のキーは、チャンネルIDで判定する
+        channel_id = key.partition("#")[0]
+        for game_data in gameset_data["games"]:
+            recorded_at = game_data.get("recorded_at", archived_at)
+            if season.includes(channel_id, recorded_at):
+                standings.add_game(game_data["scores"])
+    return standings
+
+
+def rebuild_from_archives(
+    paths: List[str],
+    guild_id: str,
+    season: Season,
+    member_ids: Optional[Mapping[str, int]] = None,
+    workers: Optional[int] = None,
+) -> SeasonStandings:
+    """アーカイブからシーズンの順位表を作り直す。アーカイブは複数のプロセスで並列に読み込む"""
+    # 集計に使うのは定義のみのため、順位表を持たないコピーを渡す
+    definition = Season(season.name, season.start, season.end, season.channels)
+    standings = SeasonStandings()
+    if len(paths) <= 1 or workers == 1:
+        for path in paths:
+            standings.merge(aggregate_archive(path, guild_id, definition, member_ids))
+        return standings
+    # ボットのスレッドを引き継がないよう、fork ではなく spawn でプロセスを起動する。
+    # spawn ではワーカーが起動スクリプトを読み込み直すため、app/main.py はボットの
+    # 起動を __main__ の場合に限っている
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for partial in executor.map(
+            aggregate_archive,
+            paths,
+            [guild_id] * len(paths),
+            [definition] * len(paths),
+            [member_ids] * len(paths),
+        ):
+            standings.merge(partial)
+    return standings
@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import struct
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from app.core.durable_writer import atomic_write
+
+# スナップショットのファイル形式
+#   ヘッダ:   MAGIC, エントリ数 (u32)
+#   インデックス: エントリごとに (ギルドID長 u16, チャンネルID長 u16, データ長 u32,
+#                オフセット u64, ギルドID, チャンネルID)
+#   データ:   チャンネルごとのゲームセットを encode したもの (デフォルトは compact JSON)
+MAGIC = b"MJSNAP01"
+_HEADER = struct.Struct("<8sI")
+_ENTRY = struct.Struct("<HHIQ")
+
+
+Encoder = Callable[[Any], bytes]
+Decoder = Callable[[bytes], Any]
+
+
+class SnapshotFormatError(ValueError):
+    pass
+
+
+def _encode_gameset(gameset_data: Dict[str, Any]) -> bytes:
+    return json.dumps(gameset_data, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+class LazyChannels(MutableMapping[str, Dict[str, Any]]):
+    """スナップショット上のチャンネルを、最初にアクセスされた時点で復元するマッピング
+
+    チャンネルごとにエンコード済みのバイト列を保持し、保存時は mark_dirty で
+    変更を通知されたチャンネルのみをエンコードし直す。
+    """
+
+    def __init__(
+        self,
+        buffer: Union[mmap.mmap, bytes] = b"",
+        raw: Optional[Dict[str, Tuple[int, int]]] = None,
+        decode: Decoder = json.loads,
+    ) -> None:
+        self._buffer = buffer
+        self._decode = decode
+        # 未復元のチャンネル: { channel_id: (オフセット, データ長) }
+        self._raw = raw if raw is not None else {}
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+        # 復元後に変更されていないチャンネルの、エンコード済みのバイト列
+        self._blobs: Dict[str, bytes] = {}
+
+    @classmethod
+    def from_dict(cls, channels: Mapping[str, Dict[str, Any]]) -> "LazyChannels":
+        """復元済みのチャンネル (JSON から読み込んだものなど) を変更の追跡の対象にする"""
+        lazy_channels = cls()
+        lazy_channels._decoded.update(channels)
+        return lazy_channels
+
+    def __getitem__(self, channel_id: str) -> Dict[str, Any]:
+        if channel_id in self._decoded:
+            return self._decoded[channel_id]
+        # 復元に失敗したチャンネルは、消さずに残しておく
+        gameset_data = self.peek(channel_id)
+        offset, length = self._raw.pop(channel_id)
+        self._decoded[channel_id] = gameset_data
+        self._blobs[channel_id] = self._buffer[offset : offset + length]
+        return gameset_data
+
+    def mark_dirty(self, channel_id: str) -> None:
+        """復元したチャンネルを変更したことを通知し、次の保存でエンコードし直す"""
+        self._blobs.pop(channel_id, None)
+
+    def peek(self, channel_id: str) -> Dict[str, Any]:
+        """チャンネルを復元して返すが、未復元のチャンネルはキャッシュしない
+
+        返した値を変更しても保存されないため、読み取りにのみ使う。
+        """
+        if channel_id in self._decoded:
+            return self._decoded[channel_id]
+        offset, length = self._raw[channel_id]
+        return self._decode(self._buffer[offset : offset + length])
+
+    def scan_items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # 全チャンネルを走査する処理 (起動後の索引の作成など) で、使われていない
+        # チャンネルまで復元したままにしないようにする
+        for channel_id in self:
+            yield channel_id, self.peek(channel_id)
+
+    def __setitem__(self, channel_id: str, gameset_data: Dict[str, Any]) -> None:
+        self._raw.pop(channel_id, None)
+        self._blobs.pop(channel_id, None)
+        self._decoded[channel_id] = gameset_data
+
+    def __delitem__(self, channel_id: str) -> None:
+        if channel_id in self._raw:
+            del self._raw[channel_id]
+        else:
+            del self._decoded[channel_id]
+            self._blobs.pop(channel_id, None)
+
+    def __contains__(self, channel_id: object) -> bool:
+        return channel_id in self._decoded or channel_id in self._raw
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self._decoded)
+        yield from list(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._decoded) + len(self._raw)
+
+    def encoded_items(
+        self, encode: Encoder = _encode_gameset
+    ) -> Iterator[Tuple[str, bytes]]:
+        # 未復元のチャンネルと、変更されていないチャンネルはエンコードし直さず、
+        # 保持しているバイト列をそのまま使う
+        for channel_id, gameset_data in self._decoded.items():
+            blob = self._blobs.get(channel_id)
+            if blob is None:
+                blob = self._blobs[channel_id] = encode(gameset_data)
+            yield channel_id, blob
+        for channel_id, (offset, length) in self._raw.items():
+            yield channel_id, self._buffer[offset : offset + length]
+
+
+def scan_channels(channels: Mapping[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """チャンネルを読み取り専用で走査する (LazyChannels は復元したチャンネルを保持しない)"""
+    if isinstance(channels, LazyChannels):
+        return channels.scan_items()
+    return iter(channels.items())
+
+
+def mark_dirty(channels: Mapping[str, Any], channel_id: str) -> None:
+    """チャンネルの変更を通知する (変更を追跡しないマッピングでは何もしない)"""
+    if isinstance(channels, LazyChannels):
+        channels.mark_dirty(channel_id)
+
+
+def _encoded_items(channels: Any, encode: Encoder) -> Iterator[Tuple[str, bytes]]:
+    if isinstance(channels, LazyChannels):
+        return channels.encoded_items(encode)
+    return (
+        (channel_id, encode(gameset_data))
+        for channel_id, gameset_data in channels.items()
+    )
+
+
+def encode_snapshot(
+    gamesets: Dict[str, Any], encode: Encoder = _encode_gameset
+) -> List[bytes]:
+    """スナップショットのファイルの内容を、書き出す順のバイト列のリストで返す"""
+    index: List[Tuple[bytes, bytes, bytes]] = []
+    for guild_id, channels in gamesets.items():
+        guild_key = guild_id.encode("utf-8")
+        for channel_id, blob in _encoded_items(channels, encode):
+            index.append((guild_key, channel_id.encode("utf-8"), blob))
+
+    offset = _HEADER.size + sum(
+        _ENTRY.size + len(guild_key) + len(channel_key)
+        for guild_key, channel_key, _ in index
+    )
+    header = [_HEADER.pack(MAGIC, len(index))]
+    for guild_key, channel_key, blob in index:
+        header.append(
+            _ENTRY.pack(len(guild_key), len(channel_key), len(blob), offset)
+            + guild_key
+            + channel_key
+        )
+        offset += len(blob)
+    return header + [blob for _, _, blob in index]
+
+
+def write_snapshot(
+    path: str, gamesets: Dict[str, Any], encode: Encoder = _encode_gameset
+) -> None:
+    # 一時ファイルに書き出してから置き換えることで、書き込み途中の破損を防ぐ
+    atomic_write(path, encode_snapshot(gamesets, encode))
+
+
+def load_snapshot(path: str, decode: Decoder = json.loads) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise SnapshotFormatError(f"{path} is not a gameset snapshot")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SnapshotFormatError(f"{path} is not a gameset snapshot")
+
+    raw: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    position = _HEADER.size
+    try:
+        for _ in range(count):
+            guild_len, channel_len, length, offset = _ENTRY.unpack_from(
+                buffer, position
+            )
+            position += _ENTRY.size
+            guild_id = buffer[position : position + guild_len].decode("utf-8")
+            position += guild_len
+            channel_id = buffer[position : position + channel_len].decode("utf-8")
+            position += channel_len
+            if offset + length > len(buffer):
+                raise SnapshotFormatError(f"{path} is truncated")
+            raw.setdefault(guild_id, {})[channel_id] = (offset, length)
+    except (struct.error, UnicodeDecodeError) as e:
+        # インデックスの途中でファイルが切れている
+        raise SnapshotFormatError(f"{path} is truncated") from e
+
+    return {
+        guild_id: LazyChannels(buffer, channels, decode)
+        for guild_id, channels in raw.items()
+    }
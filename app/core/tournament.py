@@ -0,0 +1,40 @@
+from typing import Dict, List, Tuple
+
+from app.core.players import PlayerKey
+
+
+class TournamentStandings:
+    """チャンネル内の進行中の卓をまとめた順位表
+
+    卓ごとのメンバーを毎回集計し直さずに済むよう、ゲームの記録や卓の終了に
+    合わせて差分で更新する。
+    """
+
+    def __init__(self) -> None:
+        self._totals: Dict[PlayerKey, int] = {}
+        # プレイヤーが参加している卓の数。0 になったら順位表から外す
+        self._tables: Dict[PlayerKey, int] = {}
+
+    def add_score(self, player_name: PlayerKey, score: int, joined_table: bool) -> None:
+        self._totals[player_name] = self._totals.get(player_name, 0) + score
+        if joined_table:
+            self._tables[player_name] = self._tables.get(player_name, 0) + 1
+
+    def add_table(self, members: Dict[PlayerKey, int]) -> None:
+        for player_name, score in members.items():
+            self.add_score(player_name, score, True)
+
+    def remove_table(self, members: Dict[PlayerKey, int]) -> None:
+        for player_name, score in members.items():
+            self._tables[player_name] -= 1
+            if self._tables[player_name] == 0:
+                del self._tables[player_name]
+                del self._totals[player_name]
+            else:
+                self._totals[player_name] -= score
+
+    def ranking(self) -> List[Tuple[PlayerKey, int]]:
+        return sorted(self._totals.items(), key=lambda item: item[1], reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._totals)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+import discord
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Discord はインタラクションへの最初の応答を3秒以内に要求する
+RESPONSE_DEADLINE_SECONDS = 3.0
+# 描画や送信にかかる時間を見込み、この時間を超えそうなら defer する
+DEFAULT_BUDGET_SECONDS = 2.0
+
+# 処理中に例外が発生した場合に、本人にだけ表示するメッセージ
+COMMAND_ERROR_MESSAGE = (
+    "コマンドの実行中にエラーが発生しました。時間をおいて再度お試しください。"
+)
+
+# ゲームセットの状態を変更する処理は、このワーカーで1件ずつ順番に実行する
+command_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mj-command")
+
+
+def elapsed_since(interaction: discord.Interaction) -> float:
+    """インタラクションの作成からの経過秒数 (時計のずれを考慮して丸める)"""
+    elapsed = (datetime.now(timezone.utc) - interaction.created_at).total_seconds()
+    return min(max(elapsed, 0.0), RESPONSE_DEADLINE_SECONDS)
+
+
+async def run_command(
+    interaction: discord.Interaction,
+    work: Callable[[], T],
+    render: Callable[[T], Awaitable[Tuple[str, bool]]],
+    budget: float = DEFAULT_BUDGET_SECONDS,
+    executor: Optional[Executor] = None,
+    wait_durable: Optional[Callable[[T], None]] = None,
+) -> bool:
+    """重い処理をワーカーで実行し、結果をインタラクションに返信する
+
+    `work` は executor 上で実行され、`render` はその結果から
+    (メッセージ, ephemeral) を作成する。応答期限までに `work` が終わりそうにない
+    場合は自動的に defer し、結果は followup で送信する。
+    `wait_durable` を指定した場合は、`work` の結果を渡して呼び出し、変更がディスクに
+    確定するのを待ってから応答する。途中で例外が発生した場合は、ログに記録して
+    エラーメッセージを本人にだけ送信する。defer した場合は True を返す。
+    """
+    loop = asyncio.get_running_loop()
+
+    async def execute() -> T:
+        result = await loop.run_in_executor(executor or command_executor, work)
+        if wait_durable is not None:
+            # 確定を待つ間もワーカーが次のコマンドを処理できるよう、別のスレッドで待つ
+            await loop.run_in_executor(None, wait_durable, result)
+        return result
+
+    future = asyncio.ensure_future(execute())
+
+    deferred = False
+    try:
+        remaining = budget - elapsed_since(interaction)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), max(remaining, 0.0))
+        except asyncio.TimeoutError:
+            if not interaction.response.is_done():
+                await interaction.response.defer(thinking=True)
+                deferred = True
+            result = await future
+
+        message, ephemeral = await render(result)
+    except Exception:
+        logger.exception("command failed")
+        await _send_error(interaction, deferred)
+        return deferred
+
+    if deferred:
+        if ephemeral:
+            # defer 時の応答は公開されているため、削除して本人にだけ送り直す
+            await interaction.delete_original_response()
+        await interaction.followup.send(message, ephemeral=ephemeral)
+    elif interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=ephemeral)
+    else:
+        await interaction.response.send_message(message, ephemeral=ephemeral)
+    return deferred
+
+
+async def _send_error(interaction: discord.Interaction, deferred: bool) -> None:
+    """「考え中」の表示を残さないよう、エラーメッセージで応答を完了させる"""
+    try:
+        if deferred:
+            await interaction.delete_original_response()
+            await interaction.followup.send(COMMAND_ERROR_MESSAGE, ephemeral=True)
+        elif interaction.response.is_done():
+            await interaction.followup.send(COMMAND_ERROR_MESSAGE, ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                COMMAND_ERROR_MESSAGE, ephemeral=True
+            )
+    except discord.HTTPException:
+        logger.exception("failed to send command error")
@@ -1,25 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, List, Optional, Tuple
+
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
-from typing import Optional
 
 from app.core.gameset_manager import GamesetManager
+from app.core.player_index import build_scores_completions, split_scores_input
+from app.core.players import PlayerKey, format_player
+from app.core.season import SeasonRow
+from app.discord_bot.command_runner import command_executor, run_command
+from app.discord_bot.formatting import format_table_label
+from app.discord_bot.player_history import index_player_history
+from app.discord_bot.reaper import IdleGamesetReaper
 
 # GamesetManagerのインスタンスを作成
 gameset_manager = GamesetManager()
 
+# 卓を指定するオプションの説明
+TABLE_DESCRIPTION = "卓の名前 (複数の卓で同時に集計する場合に指定します)"
+
+# record_game / get_current_scores / end_gameset の戻り値
+ScoresResult = Tuple[bool, str, Optional[List[Tuple[PlayerKey, int]]]]
+
+
+# アイドル状態のゲームセットを自動で閉じるバックグラウンドタスク
+idle_gameset_reaper = IdleGamesetReaper(gameset_manager)
+
+# シーズンの集計はアーカイブの数に比例して時間がかかるため、他のコマンドを
+# 待たせないよう専用のワーカーで実行する
+season_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mj-season")
+
+# 過去のプレイヤーを補完候補に追加するバックグラウンドタスク
+player_history_task: Optional["asyncio.Task[int]"] = None
+
+
+# メンバーを登録し、名前で入力された場合もユーザーIDで記録できるようにする
+def register_members(members: List[discord.Member], replace: bool = False) -> None:
+    registrations = [
+        (str(member.guild.id), member.id, member.display_name, [member.name])
+        for member in members
+    ]
+
+    # ゲームセットの状態と同じワーカーで更新する
+    command_executor.submit(gameset_manager.register_members, registrations, replace)
 
-# プレイヤー名からDiscordのメンション文字列を取得するヘルパー関数
-async def get_mention_from_player_name(
-    interaction: discord.Interaction, player_name: str
-) -> str:
-    """プレイヤー名からDiscordのメンション文字列を取得する"""
-    if interaction.guild:
-        # ニックネームまたはユーザー名でメンバーを検索
-        for member in interaction.guild.members:
-            if member.nick == player_name or member.name == player_name:
-                return member.mention
-    return player_name  # 見つからない場合は元のプレイヤー名を返す
+
+# 失敗したコマンドは何も変更していないため、確定を待たずに応答する
+def wait_for_commit_if_succeeded(result: Tuple[Any, ...]) -> None:
+    if result[0]:
+        gameset_manager.wait_for_commit()
 
 
 class ConfirmStartGamesetView(View):
@@ -51,16 +83,20 @@ class ConfirmStartGamesetView(View):
 @discord.app_commands.command(
     name="mj_start", description="麻雀のスコア集計を開始します。"
 )
-async def mj_start(interaction: discord.Interaction):  # type: ignore
+@discord.app_commands.describe(table=TABLE_DESCRIPTION)
+async def mj_start(
+    interaction: discord.Interaction, table: Optional[str] = None  # type: ignore
+):
     guild_id = str(interaction.guild_id)
     channel_id = str(interaction.channel_id)
 
     # 既存のゲームセットがあるか確認し、確認ダイアログを表示
-    if (
-        guild_id in gameset_manager.current_gamesets
-        and channel_id in gameset_manager.current_gamesets[guild_id]
-        and gameset_manager.current_gamesets[guild_id][channel_id]["status"] == "active"
-    ):
+    # (保存中はロックが解放されるまで待つため、イベントループではなくワーカーで確認する)
+    is_active = await asyncio.get_running_loop().run_in_executor(
+        command_executor,
+        partial(gameset_manager.is_active, guild_id, channel_id, table),
+    )
+    if is_active:
         view = ConfirmStartGamesetView(guild_id, channel_id)
         await interaction.response.send_message(
             "すでにこのチャンネルでゲームセットが進行中です。現在のゲームセットを破棄して、新しいゲームセットを開始しますか？",
@@ -75,13 +111,21 @@ async def mj_start(interaction: discord.Interaction):  # type: ignore
             )
             return
 
-    success, message_prefix = gameset_manager.start_gameset(guild_id, channel_id)
-    final_message = (
-        f"{message_prefix} `/mj_record` でゲーム結果を入力してください。"
-        if success
-        else message_prefix
+    async def render(result: Tuple[bool, str]) -> Tuple[str, bool]:
+        success, message_prefix = result
+        final_message = (
+            f"{message_prefix}{format_table_label(table)} `/mj_record` でゲーム結果を入力してください。"
+            if success
+            else message_prefix
+        )
+        return final_message, not success
+
+    await run_command(
+        interaction,
+        partial(gameset_manager.start_gameset, guild_id, channel_id, table),
+        render,
+        wait_durable=wait_for_commit_if_succeeded,
     )
-    await interaction.response.send_message(final_message, ephemeral=not success)
 
 
 # ゲーム結果記録コマンド
@@ -107,6 +151,7 @@ async def mj_start(interaction: discord.Interaction):  # type: ignore
     rule="ゲームのルールを選択してください",
     players="参加人数を選択してください",
     scores="プレイヤー名とスコアのペアをカンマ区切りで入力してください (例: @player1:25000, @player2:15000, @player3:-10000, @player4:-30000)",
+    table=TABLE_DESCRIPTION,
 )
 async def mj_record(
     interaction: discord.Interaction,  # type: ignore
@@ -114,55 +159,102 @@ async def mj_record(
     rule: str,
     players: int,
     scores: str,
+    table: Optional[str] = None,
 ):
     guild_id = str(interaction.guild_id)
     channel_id = str(interaction.channel_id)
 
-    success, message, sorted_scores = gameset_manager.record_game(
-        guild_id,
-        channel_id,
-        rule,
-        players,
-        scores,
-        service,
+    async def render(result: ScoresResult) -> Tuple[str, bool]:
+        success, message, sorted_scores = result
+        if success and sorted_scores:
+            result_parts = []
+            for i, (player, score) in enumerate(sorted_scores):
+                rank = i + 1
+                result_parts.append(f"{format_player(player)}: {score} ({rank}着)")
+            final_message = f"{message}{format_table_label(table)}\n" + ", ".join(
+                result_parts
+            )
+        else:
+            final_message = message
+        return final_message, not success
+
+    await run_command(
+        interaction,
+        partial(
+            gameset_manager.record_game,
+            guild_id,
+            channel_id,
+            rule,
+            players,
+            scores,
+            service,
+            table,
+        ),
+        render,
+        wait_durable=wait_for_commit_if_succeeded,
     )
 
-    if success and sorted_scores:
-        result_parts = []
-        for i, (player, score) in enumerate(sorted_scores):
-            rank = i + 1
-            mention = await get_mention_from_player_name(interaction, player)
-            result_parts.append(f"{mention}: {score} ({rank}着)")
-        final_message = f"{message}\n" + ", ".join(result_parts)
-    else:
-        final_message = message
 
-    await interaction.response.send_message(final_message, ephemeral=not success)
+@mj_record.autocomplete("scores")
+async def mj_record_scores_autocomplete(
+    interaction: discord.Interaction, current: str  # type: ignore
+) -> List[discord.app_commands.Choice[str]]:
+    _, prefix = split_scores_input(current)
+    if prefix is None:
+        return []
+    # 検索は短時間で終わるため、コマンドのワーカーに積まずにイベントループで行う
+    candidates = gameset_manager.search_player_names(str(interaction.guild_id), prefix)
+    return [
+        discord.app_commands.Choice(name=label, value=value)
+        for label, value in build_scores_completions(current, candidates)
+    ]
+
+
+async def on_member_join(member: discord.Member) -> None:
+    register_members([member])
+
+
+async def on_member_remove(member: discord.Member) -> None:
+    # 抜けたメンバーの名前は、以降はゲストの名前として扱う
+    command_executor.submit(
+        gameset_manager.unregister_member, str(member.guild.id), member.id
+    )
+
+
+async def on_member_update(before: discord.Member, after: discord.Member) -> None:
+    # 表示名が変わっても記録はユーザーIDのまま、補完候補と表示名だけを更新する
+    if before.display_name != after.display_name or before.name != after.name:
+        register_members([after])
 
 
 # 現在のスコア表示コマンド
 @discord.app_commands.command(
     name="mj_scores", description="現在のトータルスコアと順位を表示します。"
 )
-async def mj_scores(interaction: discord.Interaction):  # type: ignore
+@discord.app_commands.describe(table=TABLE_DESCRIPTION)
+async def mj_scores(
+    interaction: discord.Interaction, table: Optional[str] = None  # type: ignore
+):
     guild_id = str(interaction.guild_id)
     channel_id = str(interaction.channel_id)
 
-    success, message, sorted_scores = gameset_manager.get_current_scores(
-        guild_id, channel_id
-    )
+    async def render(result: ScoresResult) -> Tuple[str, bool]:
+        success, message, sorted_scores = result
+        if success and sorted_scores:
+            result_message = f"## 現在のトータルスコア{format_table_label(table)}\n"
+            for i, (player, score) in enumerate(sorted_scores):
+                rank = i + 1
+                result_message += f"- {format_player(player)}: {score} ({rank}位)\n"
+            final_message = result_message
+        else:
+            final_message = message
+        return final_message, not success
 
-    if success and sorted_scores:
-        result_message = "## 現在のトータルスコア\n"
-        for i, (player, score) in enumerate(sorted_scores):
-            rank = i + 1
-            mention = await get_mention_from_player_name(interaction, player)
-            result_message += f"- {mention}: {score} ({rank}位)\n"
-        final_message = result_message
-    else:
-        final_message = message
-
-    await interaction.response.send_message(final_message, ephemeral=not success)
+    await run_command(
+        interaction,
+        partial(gameset_manager.get_current_scores, guild_id, channel_id, table),
+        render,
+    )
 
 
 # ゲームセット完了コマンド
@@ -170,27 +262,184 @@ async def mj_scores(interaction: discord.Interaction):  # type: ignore
     name="mj_end",
     description="麻雀のスコア集計を完了し、結果を出力します。",
 )
-async def mj_end(interaction: discord.Interaction):  # type: ignore
+@discord.app_commands.describe(table=TABLE_DESCRIPTION)
+async def mj_end(
+    interaction: discord.Interaction, table: Optional[str] = None  # type: ignore
+):
+    guild_id = str(interaction.guild_id)
+    channel_id = str(interaction.channel_id)
+
+    async def render(result: ScoresResult) -> Tuple[str, bool]:
+        success, message, sorted_scores = result
+        if success and sorted_scores:
+            result_message = f"## 麻雀ゲームセット結果{format_table_label(table)}\n"
+            for i, (player, score) in enumerate(sorted_scores):
+                rank = i + 1
+                result_message += f"- {format_player(player)}: {score} ({rank}位)\n"
+            final_message = result_message
+        else:
+            final_message = message
+        return final_message, not success
+
+    await run_command(
+        interaction,
+        partial(gameset_manager.end_gameset, guild_id, channel_id, table),
+        render,
+        wait_durable=wait_for_commit_if_succeeded,
+    )
+
+
+# 全卓の順位表示コマンド
+@discord.app_commands.command(
+    name="mj_standings",
+    description="チャンネル内で進行中の全卓を合計した順位を表示します。",
+)
+async def mj_standings(interaction: discord.Interaction):  # type: ignore
     guild_id = str(interaction.guild_id)
     channel_id = str(interaction.channel_id)
 
-    success, message, sorted_scores = gameset_manager.end_gameset(guild_id, channel_id)
+    async def render(result: ScoresResult) -> Tuple[str, bool]:
+        success, message, sorted_scores = result
+        if success and sorted_scores:
+            result_message = "## 全卓のトータルスコア\n"
+            for i, (player, score) in enumerate(sorted_scores):
+                rank = i + 1
+                result_message += f"- {format_player(player)}: {score} ({rank}位)\n"
+            final_message = result_message
+        else:
+            final_message = message
+        return final_message, not success
+
+    await run_command(
+        interaction,
+        partial(gameset_manager.get_standings, guild_id, channel_id),
+        render,
+    )
+
+
+# シーズンの登録コマンド
+@discord.app_commands.command(
+    name="mj_season_define",
+    description="期間と対象のチャンネルを指定してシーズンを登録し、順位表を作成します。",
+)
+@discord.app_commands.describe(
+    name="シーズンの名前",
+    start="開始日 (例: 2024-04-01)",
+    end="終了日 (例: 2024-04-30)",
+    channels="対象のチャンネル (例: #卓1 #卓2)。省略するとすべてのチャンネルが対象になります",
+)
+async def mj_season_define(
+    interaction: discord.Interaction,  # type: ignore
+    name: str,
+    start: str,
+    end: str,
+    channels: Optional[str] = None,
+):
+    guild_id = str(interaction.guild_id)
+
+    async def render(result: Tuple[bool, str]) -> Tuple[str, bool]:
+        success, message = result
+        return message, not success
 
-    if success and sorted_scores:
-        result_message = "## 麻雀ゲームセット結果\n"
-        for i, (player, score) in enumerate(sorted_scores):
+    await run_command(
+        interaction,
+        partial(gameset_manager.define_season, guild_id, name, start, end, channels),
+        render,
+        executor=season_executor,
+    )
+
+
+# シーズンの順位表示コマンド
+@discord.app_commands.command(
+    name="mj_season",
+    description="シーズンの順位 (合計スコア・ゲーム数・着順) を表示します。",
+)
+@discord.app_commands.describe(name="シーズンの名前")
+async def mj_season(interaction: discord.Interaction, name: str):  # type: ignore
+    guild_id = str(interaction.guild_id)
+
+    async def render(
+        result: Tuple[bool, str, Optional[List[SeasonRow]]],
+    ) -> Tuple[str, bool]:
+        success, message, ranking = result
+        if not success or not ranking:
+            return message, True
+        result_message = f"## {message}\n"
+        for i, (player, points, games, placements) in enumerate(ranking):
             rank = i + 1
-            mention = await get_mention_from_player_name(interaction, player)
-            result_message += f"- {mention}: {score} ({rank}位)\n"
-        final_message = result_message
-    else:
-        final_message = message
+            placement_counts = " / ".join(
+                f"{place}着 {count}"
+                for place, count in enumerate(placements, start=1)
+                if count
+            )
+            result_message += (
+                f"- {format_player(player)}: {points} ({rank}位) "
+                f"{games}戦 [{placement_counts}]\n"
+            )
+        return result_message, False
 
-    await interaction.response.send_message(final_message, ephemeral=not success)
+    await run_command(
+        interaction,
+        partial(gameset_manager.get_season_standings, guild_id, name),
+        render,
+    )
+
+
+@mj_season.autocomplete("name")
+@mj_season_define.autocomplete("name")
+async def season_autocomplete(
+    interaction: discord.Interaction, current: str  # type: ignore
+) -> List[discord.app_commands.Choice[str]]:
+    seasons = await asyncio.get_running_loop().run_in_executor(
+        command_executor,
+        partial(gameset_manager.list_seasons, str(interaction.guild_id)),
+    )
+    return [
+        discord.app_commands.Choice(name=season, value=season)
+        for season in seasons
+        if season.casefold().startswith(current.casefold())
+    ][:25]
+
+
+@mj_record.autocomplete("table")
+@mj_scores.autocomplete("table")
+@mj_end.autocomplete("table")
+async def table_autocomplete(
+    interaction: discord.Interaction, current: str  # type: ignore
+) -> List[discord.app_commands.Choice[str]]:
+    tables = await asyncio.get_running_loop().run_in_executor(
+        command_executor,
+        partial(
+            gameset_manager.list_tables,
+            str(interaction.guild_id),
+            str(interaction.channel_id),
+        ),
+    )
+    return [
+        discord.app_commands.Choice(name=table, value=table)
+        for table in tables
+        if table.casefold().startswith(current.casefold())
+    ][:25]
 
 
 def setup(bot: commands.Bot):
+    global player_history_task
     bot.tree.add_command(mj_start)
     bot.tree.add_command(mj_record)
     bot.tree.add_command(mj_scores)
     bot.tree.add_command(mj_end)
+    bot.tree.add_command(mj_standings)
+    bot.tree.add_command(mj_season_define)
+    bot.tree.add_command(mj_season)
+    bot.add_listener(on_member_join)
+    bot.add_listener(on_member_update)
+    bot.add_listener(on_member_remove)
+    idle_gameset_reaper.start(bot)
+    for guild in bot.guilds:
+        # メンバーの一覧を取得済みの場合は、停止中にサーバーから抜けたメンバーの名前も外す
+        register_members(list(guild.members), replace=guild.chunked)
+    # メンバーの登録の後に実行されるよう、登録と同じワーカーを使って追加する
+    if player_history_task is None:
+        player_history_task = asyncio.get_running_loop().create_task(
+            index_player_history(gameset_manager)
+        )
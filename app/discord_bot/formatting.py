@@ -0,0 +1,6 @@
+from typing import Optional
+
+
+def format_table_label(table: Optional[str]) -> str:
+    """メッセージの見出しに付ける卓の名前 (既定の卓の場合は空文字列)"""
+    return f" (卓: {table})" if table else ""
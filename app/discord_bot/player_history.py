@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Optional
+
+from app.core.data_manager import list_archive_files
+from app.core.gameset_manager import GamesetManager, load_archive_player_names
+from app.discord_bot.command_runner import command_executor
+
+# 現在のゲームセットを補完候補に追加する際、1度に処理するギルドの数
+HISTORY_INDEX_GUILD_CHUNK = 20
+
+
+async def index_player_history(
+    manager: GamesetManager,
+    guild_chunk: int = HISTORY_INDEX_GUILD_CHUNK,
+    executor: Optional[Executor] = None,
+) -> int:
+    """現在のゲームセットとアーカイブのプレイヤーを、補完候補に少しずつ追加する
+
+    起動直後の補完やコマンドを待たせないよう、アーカイブの読み込みは既定の
+    スレッドプールで行い、インデックスへの追加だけをコマンドと同じワーカーで
+    小分けに実行する。読み込んだアーカイブの数を返す。
+    """
+    loop = asyncio.get_running_loop()
+    worker = executor or command_executor
+
+    guild_ids = await loop.run_in_executor(worker, manager.current_guild_ids)
+    for i in range(0, len(guild_ids), guild_chunk):
+        await loop.run_in_executor(
+            worker, manager.index_current_gamesets, guild_ids[i : i + guild_chunk]
+        )
+
+    paths = await loop.run_in_executor(None, list_archive_files)
+    for path in paths:
+        players = await loop.run_in_executor(None, load_archive_player_names, path)
+        if players:
+            await loop.run_in_executor(worker, manager.index_player_names, players)
+    return len(paths)
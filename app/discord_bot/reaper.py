@@ -0,0 +1,115 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from functools import partial
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import discord
+from discord.ext import commands, tasks
+
+from app.core.gameset_manager import GamesetManager, split_gameset_key
+from app.core.players import PlayerKey, format_player
+from app.discord_bot.command_runner import command_executor
+from app.discord_bot.formatting import format_table_label
+
+# 最終更新からこの時間が経過した進行中のゲームセットを自動で閉じる (0 で無効)
+IDLE_TTL_HOURS = float(os.getenv("MJ_IDLE_TTL_HOURS", "0"))
+# アイドル状態のゲームセットを探す間隔
+REAPER_INTERVAL_MINUTES = float(os.getenv("MJ_REAPER_INTERVAL_MINUTES", "10"))
+# 1度に閉じるゲームセットの数と、次のバッチまでの待ち時間
+REAPER_BATCH_SIZE = int(os.getenv("MJ_REAPER_BATCH_SIZE", "20"))
+REAPER_BATCH_PAUSE_SECONDS = float(os.getenv("MJ_REAPER_BATCH_PAUSE_SECONDS", "1"))
+# 閉じたゲームセットの結果をチャンネルに投稿するか
+REAPER_POST_SUMMARY = os.getenv("MJ_REAPER_POST_SUMMARY", "1") == "1"
+
+
+ClosedGameset = Tuple[str, str, Optional[List[Tuple[PlayerKey, int]]]]
+
+
+async def reap_idle_gamesets(
+    manager: GamesetManager,
+    ttl_seconds: float,
+    batch_size: int,
+    on_closed: Optional[Callable[[ClosedGameset], Awaitable[None]]] = None,
+    pause_seconds: float = 0.0,
+    executor: Optional[Executor] = None,
+) -> int:
+    """アイドル状態のゲームセットをバッチに分けて閉じ、閉じた件数を返す
+
+    各バッチはコマンドと同じワーカーで実行し、バッチの間に待ち時間を入れることで
+    対話的なコマンドが長時間待たされないようにする。現在の状態全体を書き出す
+    アーカイブは、バッチごとではなく巡回の最後に1回だけ行う。
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or command_executor
+    closed_count = 0
+    try:
+        while True:
+            closed = await loop.run_in_executor(
+                executor,
+                partial(
+                    manager.close_idle_gamesets, ttl_seconds, batch_size, archive=False
+                ),
+            )
+            closed_count += len(closed)
+            if on_closed:
+                for result in closed:
+                    await on_closed(result)
+            if len(closed) < batch_size:
+                return closed_count
+            await asyncio.sleep(pause_seconds)
+    finally:
+        await loop.run_in_executor(executor, manager.archive_ended_gamesets)
+
+
+def format_idle_summary(
+    sorted_scores: Optional[List[Tuple[PlayerKey, int]]],
+    ttl_hours: float,
+    table: Optional[str] = None,
+) -> Optional[str]:
+    if not sorted_scores:
+        return None
+    result_message = (
+        f"## 麻雀ゲームセット結果{format_table_label(table)}\n"
+        f"{ttl_hours:g}時間更新がなかったため、ゲームセットを自動で終了しました。\n"
+    )
+    for i, (player, score) in enumerate(sorted_scores):
+        rank = i + 1
+        result_message += f"- {format_player(player)}: {score} ({rank}位)\n"
+    return result_message
+
+
+class IdleGamesetReaper:
+    def __init__(self, manager: GamesetManager, ttl_hours: float = IDLE_TTL_HOURS):
+        self.manager = manager
+        self.ttl_hours = ttl_hours
+        self.bot: Optional[commands.Bot] = None
+        self.task = tasks.loop(minutes=REAPER_INTERVAL_MINUTES)(self.run)
+
+    def start(self, bot: commands.Bot) -> None:  # pragma: no cover
+        self.bot = bot
+        if self.ttl_hours > 0 and not self.task.is_running():
+            self.task.start()
+
+    async def run(self) -> None:  # pragma: no cover
+        await reap_idle_gamesets(
+            self.manager,
+            self.ttl_hours * 3600,
+            REAPER_BATCH_SIZE,
+            self.post_summary if REAPER_POST_SUMMARY else None,
+            REAPER_BATCH_PAUSE_SECONDS,
+        )
+
+    async def post_summary(self, closed: ClosedGameset) -> None:  # pragma: no cover
+        _, key, sorted_scores = closed
+        channel_id, table = split_gameset_key(key)
+        channel = self.bot.get_channel(int(channel_id)) if self.bot else None
+        if not isinstance(channel, discord.abc.Messageable):
+            return
+        # 閉じる判定に使った時間を、そのまま結果に表示する
+        message = format_idle_summary(sorted_scores, self.ttl_hours, table)
+        if message:
+            try:
+                await channel.send(message)
+            except discord.HTTPException:
+                pass
@@ -3,8 +3,6 @@ import os
 import discord
 from discord.ext import commands
 
-from app.discord_bot.commands import setup as setup_commands
-
 # 環境変数からDiscordボットのトークンを取得
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
@@ -21,6 +19,10 @@ async def on_ready():  # pragma: no cover
     print(f"Logged in as {bot.user} (ID: {bot.user.id})")  # pragma: no cover
     print("------")  # pragma: no cover
     # コマンドをセットアップ
+    # (コマンドのモジュールは読み込み時にゲームセットを読み込むため、シーズンの集計で
+    # spawn されたワーカーがこのファイルを読み込み直しても読み込まれないようにする)
+    from app.discord_bot.commands import setup as setup_commands
+
     setup_commands(bot)
     # 起動時にスラッシュコマンドを同期
     await bot.tree.sync()  # pragma: no cover
@@ -28,7 +30,8 @@ async def on_ready():  # pragma: no cover
 
 
 # ボットの実行
-if DISCORD_BOT_TOKEN:  # pragma: no cover
-    bot.run(DISCORD_BOT_TOKEN)  # pragma: no cover
-else:  # pragma: no cover
-    print("DISCORD_BOT_TOKEN 環境変数が設定されていません。")  # pragma: no cover
+if __name__ == "__main__":  # pragma: no cover
+    if DISCORD_BOT_TOKEN:
+        bot.run(DISCORD_BOT_TOKEN)
+    else:
+        print("DISCORD_BOT_TOKEN 環境変数が設定されていません。")
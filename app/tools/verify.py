@@ -0,0 +1,222 @@
+"""保存されたゲームセットとアーカイブを検証する
+
+python -m app.tools.verify [--rebuild] [--workers N]
+
+各ゲームを記録時と同じ条件 (人数とゼロサム) で検証し、members の合計が
+ゲームのスコアの合計と一致するかを確認する。アーカイブは複数のプロセスで
+並列に検証する。--rebuild を指定すると、members の合計とシーズンの順位表を
+ゲームの記録から作り直す (ボットを停止した状態で実行すること)。
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core import data_manager
+from app.core.durable_writer import atomic_write
+from app.core.players import (
+    PlayerKey,
+    name_owners,
+    normalize_gameset_players,
+    unique_member_ids,
+)
+from app.core.scores import validate_scores
+from app.core.season import Season, rebuild_from_archives
+from app.core.snapshot import mark_dirty
+
+
+class FileReport:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.gamesets = 0
+        self.games = 0
+        # 修正できない問題 (ゲームの条件違反など)
+        self.issues: List[str] = []
+        # members の合計の不一致 (--rebuild で修正される)
+        self.mismatches: List[str] = []
+        self.error: Optional[str] = None
+        self.rebuilt = False
+
+
+def _game_totals(games: List[Dict[str, Any]]) -> Dict[PlayerKey, int]:
+    totals: Dict[PlayerKey, int] = {}
+    for game_data in games:
+        for player, score in game_data["scores"].items():
+            totals[player] = totals.get(player, 0) + score
+    return totals
+
+
+def verify_gamesets(
+    gamesets: Dict[str, Any], report: FileReport, rebuild: bool = False
+) -> bool:
+    """ゲームセットを検証し、結果を report に追加する。members を修正した場合は True を返す"""
+    changed = False
+    for guild_id, channels in gamesets.items():
+        for key, gameset_data in channels.items():
+            report.gamesets += 1
+            location = f"{guild_id}/{key}"
+            # 名前で記録された古いデータも、ボットと同じキーで集計する
+            if normalize_gameset_players(gameset_data):
+                mark_dirty(channels, key)
+            games = gameset_data.get("games", [])
+            for i, game_data in enumerate(games, start=1):
+                report.games += 1
+                scores = game_data["scores"]
+                error = validate_scores(
+                    scores, game_data.get("players_count", len(scores))
+                )
+                if error:
+                    report.issues.append(f"{location} {i}ゲーム目: {error}")
+
+            members = gameset_data.get("members", {})
+            totals = _game_totals(games)
+            if dict(members) == totals:
+                continue
+            diff = {
+                player: (members.get(player), totals.get(player))
+                for player in {*members, *totals}
+                if members.get(player) != totals.get(player)
+            }
+            report.mismatches.append(
+                f"{location}: members の合計がゲームの合計と一致しません "
+                f"{{プレイヤー: (members, ゲームの合計)}} = {diff}"
+            )
+            if rebuild:
+                gameset_data["members"] = totals
+                mark_dirty(channels, key)
+                changed = True
+    return changed
+
+
+def verify_file(path: str, rebuild: bool = False) -> FileReport:
+    """アーカイブを1つ検証する。プロセスプールのワーカーで実行される"""
+    report = FileReport(path)
+    try:
+        with open(path, "rb") as f:
+            gamesets = data_manager.decode_data(f.read())
+        changed = verify_gamesets(gamesets, report, rebuild)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        # 読み込めないファイルや、想定と異なる構造のファイル
+        report.error = f"{type(e).__name__}: {e}"
+        return report
+    if changed:
+        atomic_write(path, [data_manager.get_codec().encode(gamesets)])
+        report.rebuilt = True
+    return report
+
+
+def verify_live(rebuild: bool = False) -> FileReport:
+    """現在の状態 (gamesets.json またはスナップショット) を検証する"""
+    report = FileReport(data_manager.DATA_FILE)
+    try:
+        gamesets = data_manager.load_gamesets()
+        changed = verify_gamesets(gamesets, report, rebuild)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        report.error = f"{type(e).__name__}: {e}"
+        return report
+    if changed:
+        data_manager.save_gamesets(gamesets)
+        report.rebuilt = True
+    return report
+
+
+def verify_archives(
+    paths: List[str], rebuild: bool = False, workers: Optional[int] = None
+) -> Iterator[FileReport]:
+    """アーカイブを並列に検証し、検証が終わった順ではなくパスの順に結果を返す"""
+    verify = partial(verify_file, rebuild=rebuild)
+    if workers == 1 or len(paths) <= 1:
+        yield from map(verify, paths)
+        return
+    workers = workers or os.cpu_count() or 1
+    # ファイル数が多い場合は、まとめてワーカーに渡してプロセス間の通信を減らす
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(verify, paths, chunksize=chunksize)
+
+
+def rebuild_seasons(
+    paths: List[str], workers: Optional[int] = None
+) -> List[Tuple[str, str]]:
+    """保存されたシーズンの順位表を、アーカイブから作り直す"""
+    seasons = data_manager.load_seasons()
+    # 名前で記録されたプレイヤーは、ボットが保存した対応でユーザーIDにまとめる
+    members = data_manager.load_members()
+    rebuilt = []
+    for guild_id, guild_seasons in seasons.items():
+        for name, season_data in guild_seasons.items():
+            season = Season.from_dict(name, season_data)
+            member_ids = unique_member_ids(name_owners(members.get(guild_id, {})))
+            season.final = rebuild_from_archives(
+                paths, guild_id, season, member_ids, workers
+            )
+            guild_seasons[name] = season.to_dict()
+            rebuilt.append((guild_id, name))
+    if rebuilt:
+        data_manager.save_seasons(seasons)
+    return rebuilt
+
+
+def _print_report(report: FileReport, rebuild: bool) -> None:
+    if report.error:
+        print(f"{report.path}: 読み込めません ({report.error})")
+    for issue in report.issues:
+        print(f"{report.path}: {issue}")
+    for mismatch in report.mismatches:
+        suffix = " (修正しました)" if rebuild else ""
+        print(f"{report.path}: {mismatch}{suffix}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.tools.verify",
+        description="保存されたゲームセットとアーカイブを検証します。",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="members の合計とシーズンの順位表をゲームの記録から作り直す",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="アーカイブを検証するプロセス数 (デフォルト: CPU数)",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    paths = data_manager.list_archive_files()
+    reports = []
+    for report in verify_archives(paths, args.rebuild, args.workers):
+        _print_report(report, args.rebuild)
+        reports.append(report)
+    live_report = verify_live(args.rebuild)
+    _print_report(live_report, args.rebuild)
+    reports.append(live_report)
+
+    if args.rebuild:
+        for guild_id, name in rebuild_seasons(paths, args.workers):
+            print(f"シーズン「{name}」({guild_id}) の順位表を作り直しました")
+
+    corrupt = sum(1 for report in reports if report.error)
+    issues = sum(len(report.issues) for report in reports)
+    mismatches = sum(len(report.mismatches) for report in reports)
+    print(
+        f"{len(paths)}件のアーカイブと現在の状態を検証しました "
+        f"({sum(report.gamesets for report in reports)}ゲームセット, "
+        f"{sum(report.games for report in reports)}ゲーム, "
+        f"{time.perf_counter() - started:.2f}秒): "
+        f"条件違反 {issues}件, 合計の不一致 {mismatches}件, 読み込めないファイル {corrupt}件"
+    )
+    if corrupt or issues or (mismatches and not args.rebuild):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""利用できる各コーデックのエンコード・デコード時間とサイズを比較する
+
+python -m benchmarks.bench_codecs [ギルド数] [ギルドあたりのチャンネル数]
+"""
+
+import sys
+import time
+
+from app.core.data_manager import CODECS
+from benchmarks.bench_snapshot import make_gamesets
+
+
+def main() -> None:
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    gamesets = make_gamesets(guilds, channels)
+
+    print(f"guilds={guilds} channels/guild={channels}")
+    for name, codec in CODECS.items():
+        start = time.perf_counter()
+        encoded = codec.encode(gamesets)
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        codec.decode(encoded)
+        decode_time = time.perf_counter() - start
+
+        print(
+            f"{name:>13}: encode {encode_time * 1000:8.1f} ms  "
+            f"decode {decode_time * 1000:8.1f} ms  size {len(encoded):>12,} B"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""gamesets.json とバイナリスナップショットの読み込み時間・ピークメモリを比較する
+
+スナップショットについては、起動後に行う索引の作成 (補完候補・アイドル検索・
+シーズン) と最初の保存までを含めた時間も計測する。
+
+python -m benchmarks.bench_snapshot [ギルド数] [ギルドあたりのチャンネル数]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Tuple
+
+from app.core import data_manager
+from app.core.gameset_manager import GamesetManager
+from app.core.season import Season
+from app.core.snapshot import LazyChannels, load_snapshot, write_snapshot
+
+SEASON_NAME = "bench"
+
+
+def make_gamesets(guilds: int, channels: int, games: int = 20) -> Dict[str, Any]:
+    gamesets: Dict[str, Any] = {}
+    for g in range(guilds):
+        gamesets[str(10**17 + g)] = {
+            str(10**18 + c): {
+                "status": "active",
+                "games": [
+                    {
+                        "rule": "hanchan",
+                        "players_count": 4,
+                        "scores": {
+                            "p1": 25000,
+                            "p2": 15000,
+                            "p3": -10000,
+                            "p4": -30000,
+                        },
+                        "service": "jantama",
+                    }
+                    for _ in range(games)
+                ],
+                "members": {"p1": 500000, "p2": 300000, "p3": -200000, "p4": -600000},
+            }
+            for c in range(channels)
+        }
+    return gamesets
+
+
+def end_all_but_first(gamesets: Dict[str, Any]) -> Dict[str, Any]:
+    # 終了したゲームセットはアーカイブ後に空の状態で残り、進行中は各ギルド1つとする
+    return {
+        guild_id: {
+            channel_id: (
+                gameset_data
+                if i == 0
+                else {"status": "inactive", "games": [], "members": {}}
+            )
+            for i, (channel_id, gameset_data) in enumerate(channels.items())
+        }
+        for guild_id, channels in gamesets.items()
+    }
+
+
+def start_manager() -> GamesetManager:
+    # 起動後にバックグラウンドやコマンドの初回実行で行う索引の作成まで含める
+    manager = GamesetManager("sync")
+    guild_ids = manager.current_guild_ids()
+    manager.index_current_gamesets(guild_ids)
+    manager.find_idle_gamesets(3600)
+    manager.get_season_standings(guild_ids[0], SEASON_NAME)
+    return manager
+
+
+def decoded_channels(manager: GamesetManager) -> int:
+    return sum(
+        len(channels._decoded)
+        for channels in manager.current_gamesets.values()
+        if isinstance(channels, LazyChannels)
+    )
+
+
+def measure(load: Callable[[], Any]) -> Tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def main() -> None:
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    gamesets = make_gamesets(guilds, channels)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "gamesets.json")
+        snapshot_path = os.path.join(tmp, "gamesets.snapshot")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(gamesets, f, ensure_ascii=False, indent=4)
+        write_snapshot(snapshot_path, gamesets)
+
+        def load_json() -> Any:
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        def load_snapshot_and_touch_one() -> Any:
+            # 起動直後にコマンドが使われるのは一部のチャンネルのみ
+            loaded = load_snapshot(snapshot_path)
+            guild_id = next(iter(loaded))
+            channel_id = next(iter(loaded[guild_id]))
+            loaded[guild_id][channel_id]
+            return loaded
+
+        print(f"guilds={guilds} channels/guild={channels}")
+        print(
+            f"size: json={os.path.getsize(json_path):,}B "
+            f"snapshot={os.path.getsize(snapshot_path):,}B"
+        )
+        for name, load in (
+            ("json.load", load_json),
+            ("snapshot", lambda: load_snapshot(snapshot_path)),
+            ("snapshot+1 channel", load_snapshot_and_touch_one),
+        ):
+            elapsed, peak = measure(load)
+            print(f"{name:>20}: {elapsed * 1000:8.1f} ms  peak {peak / 2**20:8.1f} MiB")
+
+        # スナップショットのみで保存している状態から起動する
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        data_manager.STORAGE_FORMAT = "snapshot"
+        try:
+            write_snapshot("gamesets.snapshot", end_all_but_first(gamesets))
+            today = date.today()
+            season = Season(
+                SEASON_NAME, today - timedelta(days=30), today + timedelta(days=30)
+            )
+            data_manager.save_seasons(
+                {guild_id: {SEASON_NAME: season.to_dict()} for guild_id in gamesets}
+            )
+
+            elapsed, peak = measure(start_manager)
+            print(
+                f"{'startup+indexing':>20}: {elapsed * 1000:8.1f} ms  "
+                f"peak {peak / 2**20:8.1f} MiB"
+            )
+            manager = start_manager()
+            start = time.perf_counter()
+            data_manager.encode_gamesets(manager.current_gamesets)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{'first save':>20}: {elapsed * 1000:8.1f} ms  "
+                f"decoded {decoded_channels(manager):,}/{guilds * channels:,} channels"
+            )
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import pytest
+
+from app.core import data_manager
+
+DATA_FILES = {
+    "DATA_FILE": "gamesets.json",
+    "SNAPSHOT_FILE": "gamesets.snapshot",
+    "SEASONS_FILE": "seasons.json",
+    "MEMBERS_FILE": "members.json",
+}
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # データファイルは一時ディレクトリに作成し、保存形式は JSON から始める
+    monkeypatch.chdir(tmp_path)
+    for name, path in DATA_FILES.items():
+        monkeypatch.setattr(data_manager, name, path)
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", "json")
+    return tmp_path
+
+
+@pytest.fixture
+def gameset_manager():
+    # 保存したデータを読み込み直すテストのため、インスタンスではなくクラスを返す
+    from app.core.gameset_manager import GamesetManager
+
+    return GamesetManager
+
+
+@pytest.fixture
+def manager(gameset_manager):
+    return gameset_manager()
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.discord_bot.command_runner import (
+    COMMAND_ERROR_MESSAGE,
+    RESPONSE_DEADLINE_SECONDS,
+    elapsed_since,
+    run_command,
+)
+
+
+def make_interaction(created_at=None, done=False):
+    response = SimpleNamespace(
+        is_done=MagicMock(return_value=done),
+        defer=AsyncMock(),
+        send_message=AsyncMock(),
+    )
+    return SimpleNamespace(
+        created_at=created_at or datetime.now(timezone.utc),
+        response=response,
+        followup=SimpleNamespace(send=AsyncMock()),
+        delete_original_response=AsyncMock(),
+    )
+
+
+async def render(result):
+    return f"result: {result}", result < 0
+
+
+def test_elapsed_since_is_clamped():
+    now = datetime.now(timezone.utc)
+    assert elapsed_since(make_interaction(now + timedelta(seconds=10))) == 0.0
+    assert (
+        elapsed_since(make_interaction(now - timedelta(seconds=10)))
+        == RESPONSE_DEADLINE_SECONDS
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_command_responds_directly():
+    interaction = make_interaction()
+
+    deferred = await run_command(interaction, lambda: 1, render)
+
+    assert deferred is False
+    interaction.response.defer.assert_not_awaited()
+    interaction.response.send_message.assert_awaited_once_with(
+        "result: 1", ephemeral=False
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_command_defers_slow_work():
+    interaction = make_interaction()
+
+    def slow_work():
+        time.sleep(0.05)
+        return 2
+
+    deferred = await run_command(interaction, slow_work, render, budget=0.01)
+
+    assert deferred is True
+    interaction.response.defer.assert_awaited_once_with(thinking=True)
+    interaction.response.send_message.assert_not_awaited()
+    interaction.delete_original_response.assert_not_awaited()
+    interaction.followup.send.assert_awaited_once_with("result: 2", ephemeral=False)
+
+
+@pytest.mark.asyncio
+async def test_run_command_defers_when_budget_already_spent():
+    # 作成から時間が経っているインタラクションは、処理を待たずに defer する
+    interaction = make_interaction(
+        datetime.now(timezone.utc) - timedelta(seconds=RESPONSE_DEADLINE_SECONDS)
+    )
+
+    def slow_work():
+        time.sleep(0.01)
+        return -1
+
+    deferred = await run_command(interaction, slow_work, render)
+
+    assert deferred is True
+    interaction.delete_original_response.assert_awaited_once()
+    interaction.followup.send.assert_awaited_once_with("result: -1", ephemeral=True)
+
+
+@pytest.mark.asyncio
+async def test_run_command_uses_followup_after_response():
+    # 確認ダイアログなどで応答済みの場合は followup で送信する
+    interaction = make_interaction(done=True)
+
+    deferred = await run_command(interaction, lambda: 3, render, budget=0.0)
+
+    assert deferred is False
+    interaction.response.defer.assert_not_awaited()
+    interaction.followup.send.assert_awaited_once_with("result: 3", ephemeral=False)
+
+
+@pytest.mark.asyncio
+async def test_run_command_reports_errors():
+    interaction = make_interaction()
+
+    def broken_work():
+        raise RuntimeError("boom")
+
+    deferred = await run_command(interaction, broken_work, render)
+
+    assert deferred is False
+    interaction.response.send_message.assert_awaited_once_with(
+        COMMAND_ERROR_MESSAGE, ephemeral=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_command_replaces_thinking_message_on_error():
+    # defer した後に失敗した場合も、「考え中」の表示を残さない
+    interaction = make_interaction()
+
+    def slow_broken_work():
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    deferred = await run_command(interaction, slow_broken_work, render, budget=0.01)
+
+    assert deferred is True
+    interaction.delete_original_response.assert_awaited_once()
+    interaction.followup.send.assert_awaited_once_with(
+        COMMAND_ERROR_MESSAGE, ephemeral=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_command_passes_result_to_wait_durable():
+    interaction = make_interaction()
+    waited = []
+
+    await run_command(interaction, lambda: -1, render, wait_durable=waited.append)
+
+    assert waited == [-1]
+    interaction.response.send_message.assert_awaited_once_with(
+        "result: -1", ephemeral=True
+    )
@@ -0,0 +1,155 @@
+import json
+import os
+
+import pytest
+
+from app.core import data_manager
+from app.core.snapshot import SnapshotFormatError, mark_dirty, write_snapshot
+
+GAMESETS = {"1": {"10": {"status": "active", "games": [], "members": {"a": 0}}}}
+
+
+def set_format(monkeypatch, storage_format):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", storage_format)
+
+
+def test_json_format(monkeypatch):
+    set_format(monkeypatch, "json")
+    assert data_manager.load_gamesets() == {}
+
+    data_manager.save_gamesets(GAMESETS)
+    assert os.path.exists("gamesets.json")
+    assert not os.path.exists("gamesets.snapshot")
+    assert data_manager.load_gamesets() == GAMESETS
+
+
+def test_snapshot_format(monkeypatch):
+    set_format(monkeypatch, "snapshot")
+    data_manager.save_gamesets(GAMESETS)
+    assert not os.path.exists("gamesets.json")
+
+    loaded = data_manager.load_gamesets()
+    assert dict(loaded["1"]) == GAMESETS["1"]
+
+    # 破損したスナップショットは JSON にフォールバックしない
+    with open("gamesets.snapshot", "wb") as f:
+        f.write(b"broken")
+    with pytest.raises(SnapshotFormatError):
+        data_manager.load_gamesets()
+
+
+def test_snapshot_format_migrates_from_json(monkeypatch):
+    set_format(monkeypatch, "json")
+    data_manager.save_gamesets(GAMESETS)
+
+    set_format(monkeypatch, "snapshot")
+    assert data_manager.load_gamesets() == GAMESETS
+
+
+def test_both_format_prefers_newer_file(monkeypatch):
+    set_format(monkeypatch, "both")
+    data_manager.save_gamesets(GAMESETS)
+    assert os.path.exists("gamesets.json")
+    assert not isinstance(data_manager.load_gamesets()["1"], dict)
+
+    # JSON の方が新しい場合は JSON を読み込む
+    os.utime("gamesets.snapshot", (0, 0))
+    assert isinstance(data_manager.load_gamesets()["1"], dict)
+
+    # スナップショットが壊れていても JSON から読み込める
+    os.utime("gamesets.snapshot", None)
+    with open("gamesets.snapshot", "wb") as f:
+        f.write(b"broken")
+    assert data_manager.load_gamesets() == GAMESETS
+
+
+def test_save_lazy_gamesets_as_json(monkeypatch):
+    write_snapshot("gamesets.snapshot", GAMESETS)
+    set_format(monkeypatch, "snapshot")
+    loaded = data_manager.load_gamesets()
+
+    set_format(monkeypatch, "json")
+    data_manager.save_gamesets(loaded)
+    with open("gamesets.json", encoding="utf-8") as f:
+        assert json.load(f) == GAMESETS
+
+    with pytest.raises(TypeError):
+        data_manager.save_gamesets({"1": object()})  # type: ignore
+
+
+def test_archive_gamesets(monkeypatch):
+    set_format(monkeypatch, "json")
+    data_manager.save_gamesets(GAMESETS)
+    assert data_manager.find_unfinished_archive() is None
+
+    # アーカイブは現在の状態のファイルを変更しない
+    archive_file = data_manager.archive_gamesets(GAMESETS)
+    assert data_manager.list_archive_files() == [archive_file]
+    assert data_manager.load_archive(archive_file) == GAMESETS
+    assert data_manager.load_gamesets() == GAMESETS
+
+    # 書き戻す前に終了した場合は、現在の状態より新しいアーカイブが残る
+    os.utime("gamesets.json", ns=(0, 0))
+    assert data_manager.find_unfinished_archive() == archive_file
+    assert not data_manager.seasons_saved_after(archive_file)
+    data_manager.save_seasons({})
+    assert data_manager.seasons_saved_after(archive_file)
+    data_manager.save_gamesets({})
+    assert data_manager.find_unfinished_archive() is None
+
+    # 同じ秒のアーカイブは上書きせず、別のファイル名にする
+    set_format(monkeypatch, "snapshot")
+    second_archive_file = data_manager.archive_gamesets(GAMESETS)
+    assert data_manager.list_archive_files() == [archive_file, second_archive_file]
+    assert data_manager.load_archive(second_archive_file) == GAMESETS
+
+
+@pytest.mark.parametrize("name", sorted(data_manager.CODECS))
+def test_codec_round_trip(name):
+    codec = data_manager.get_codec(name)
+    encoded = codec.encode(GAMESETS)
+    assert codec.decode(encoded) == GAMESETS
+    assert data_manager.decode_data(encoded) == GAMESETS
+
+
+def test_codecs():
+    pretty = data_manager.get_codec("json").encode(GAMESETS)
+    compact = data_manager.get_codec("json-compact").encode(GAMESETS)
+    assert len(compact) < len(pretty)
+    assert data_manager.detect_codec(b"  \n{}").decode(b"  \n{}") == {}
+
+    with pytest.raises(ValueError):
+        data_manager.get_codec("unknown")
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("STORAGE_FORMAT", "sqlite"), ("CODEC", "unknown"), ("DURABILITY", "never")],
+)
+def test_validate_settings(monkeypatch, name, value):
+    data_manager.validate_settings()
+    monkeypatch.setattr(data_manager, name, value)
+    with pytest.raises(ValueError):
+        data_manager.validate_settings()
+
+
+@pytest.mark.skipif("msgpack" not in data_manager.CODECS, reason="msgpack")
+@pytest.mark.parametrize("storage_format", ["json", "snapshot"])
+def test_codec_is_detected_on_load(monkeypatch, storage_format):
+    set_format(monkeypatch, storage_format)
+    monkeypatch.setattr(data_manager, "CODEC", "json")
+    data_manager.save_gamesets(GAMESETS)
+
+    # 既存のファイルは、コーデックを変更した後も読み込める
+    monkeypatch.setattr(data_manager, "CODEC", "msgpack")
+    loaded = data_manager.load_gamesets()
+    loaded["1"]["10"]["members"]["a"] = 1
+    mark_dirty(loaded["1"], "10")
+    data_manager.save_gamesets(loaded)
+
+    monkeypatch.setattr(data_manager, "CODEC", "json-compact")
+    reloaded = data_manager.load_gamesets()
+    assert reloaded["1"]["10"]["members"] == {"a": 1}
+
+    archive_file = data_manager.archive_gamesets(reloaded)
+    assert data_manager.load_archive(archive_file)["1"]["10"]["members"] == {"a": 1}
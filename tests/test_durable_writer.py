@@ -0,0 +1,211 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from app.core import data_manager
+from app.core.durable_writer import GroupCommitWriter, atomic_write
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_atomic_write_keeps_original_on_failure(monkeypatch):
+    atomic_write("data.bin", [b"original"])
+
+    def fail(fd):
+        raise OSError("disk full")
+
+    # fsync の前に失敗しても、元のファイルは残り一時ファイルも削除される
+    with monkeypatch.context() as m:
+        m.setattr(os, "fsync", fail)
+        with pytest.raises(OSError):
+            atomic_write("data.bin", [b"new", b"data"])
+
+    with open("data.bin", "rb") as f:
+        assert f.read() == b"original"
+    assert not os.path.exists("data.bin.tmp")
+
+
+def test_group_commit_batches_requests():
+    state = {"value": 0}
+    encoded = []
+
+    def encode():
+        encoded.append(state["value"])
+        return [("state.txt", [str(state["value"]).encode()])]
+
+    writer = GroupCommitWriter(encode, delay=0.05)
+    for i in range(1, 51):
+        state["value"] = i
+        ticket = writer.request()
+    writer.wait(ticket, timeout=5)
+
+    with open("state.txt", "rb") as f:
+        assert f.read() == b"50"
+    stats = writer.stats()
+    assert stats["requests"] == 50
+    assert stats["commits"] == len(encoded) < 50
+    assert stats["max_batch_size"] > 1
+    writer.close()
+
+
+def test_group_commit_reports_errors():
+    fail = threading.Event()
+    fail.set()
+
+    def encode():
+        if fail.is_set():
+            raise OSError("disk full")
+        return [("state.txt", [b"ok"])]
+
+    writer = GroupCommitWriter(encode, delay=0)
+    with pytest.raises(OSError):
+        writer.wait(writer.request(), timeout=5)
+
+    # 失敗した要求は、次の書き込みで確定する
+    fail.clear()
+    writer.wait(writer.request(), timeout=5)
+    assert os.path.exists("state.txt")
+    writer.close()
+
+
+def test_group_commit_manager(monkeypatch):
+    from app.core.gameset_manager import GamesetManager
+
+    manager = GamesetManager(durability="group")
+    manager.start_gameset("1", "10")
+    manager.record_game("1", "10", "hanchan", 4, "a:10, b:-10, c:0, d:0", "jantama")
+    manager.wait_for_commit(timeout=5)
+    assert data_manager.load_gamesets()["1"]["10"]["members"]["a"] == 10
+
+    # アーカイブは保留中の保存を書き出してから行う
+    manager.start_gameset("1", "20")
+    manager.record_game("1", "20", "hanchan", 4, "a:5, b:-5, c:0, d:0", "jantama")
+    success, _, _ = manager.end_gameset("1", "20")
+    assert success is True
+    archive_file = data_manager.list_archive_files()[0]
+    assert data_manager.load_archive(archive_file)["1"]["20"]["members"]["a"] == 5
+    # 書き戻した状態には、他のチャンネルで進行中のゲームセットが残る
+    assert data_manager.load_gamesets()["1"]["10"]["members"]["a"] == 10
+    assert data_manager.load_gamesets()["1"]["20"]["games"] == []
+    assert manager.commit_stats()["requests"] >= 1
+    manager._writer.close()  # type: ignore
+
+
+CHILD = textwrap.dedent("""
+    import sys
+
+    from app.core import data_manager
+
+    data_manager.STORAGE_FORMAT = sys.argv[1]
+    i = 0
+    while True:
+        i += 1
+        games = [{"scores": {"a": n, "b": -n}} for n in range(i % 500)]
+        members = {"a": len(games)}
+        data_manager.save_gamesets(
+            {"1": {"10": {"status": "active", "games": games, "members": members}}}
+        )
+        if i == 1:
+            print("ready", flush=True)
+    """)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="SIGKILL")
+@pytest.mark.parametrize("storage_format", ["json", "snapshot", "both"])
+def test_recovers_after_kill_during_write(monkeypatch, storage_format):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", storage_format)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for delay in (0.05, 0.1, 0.2):
+        process = subprocess.Popen(
+            [sys.executable, "-c", CHILD, storage_format],
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        assert process.stdout is not None
+        assert process.stdout.readline() == b"ready\n"
+        time.sleep(delay)
+        # 書き込みの途中で強制終了しても、最後に確定した状態を読み込める
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+        gameset_data = data_manager.load_gamesets()["1"]["10"]
+        assert gameset_data["members"]["a"] == len(gameset_data["games"])
+
+
+END_CHILD = textwrap.dedent("""
+    import os
+    import sys
+    from datetime import date, timedelta
+
+    from app.core import data_manager, gameset_manager
+
+    data_manager.STORAGE_FORMAT = sys.argv[1]
+    manager = gameset_manager.GamesetManager("group")
+    today = date.today()
+    start = (today - timedelta(days=1)).isoformat()
+    end = (today + timedelta(days=1)).isoformat()
+    manager.define_season("1", "今月", start, end)
+    manager.start_gameset("1", "10", "A")
+    manager.record_game(
+        "1", "10", "hanchan", 4, "a:30, b:10, c:-10, d:-30", "jantama", "A"
+    )
+    manager.start_gameset("2", "20")
+    manager.record_game("2", "20", "hanchan", 4, "a:5, b:-5, c:0, d:0", "jantama")
+    manager.wait_for_commit(timeout=5)
+
+    # アーカイブを作成した後、現在の状態を書き戻す前に強制終了する
+    def kill(*args):
+        os._exit(1)
+
+    setattr(gameset_manager, sys.argv[2], kill)
+    manager.end_gameset("1", "10", "A")
+    """)
+
+
+@pytest.mark.parametrize("storage_format", ["json", "snapshot"])
+@pytest.mark.parametrize("killed_at", ["save_seasons", "save_gamesets"])
+def test_recovers_after_kill_during_archive(
+    monkeypatch, gameset_manager, storage_format, killed_at
+):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", storage_format)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.run(
+        [sys.executable, "-c", END_CHILD, storage_format, killed_at],
+        env=env,
+        timeout=60,
+    )
+    assert process.returncode == 1
+
+    # 他のギルドで進行中のゲームセットは、書き戻す前に終了しても失われない
+    [archive_file] = data_manager.list_archive_files()
+    assert data_manager.load_archive(archive_file)["1"]["10#A"]["status"] == "inactive"
+    assert data_manager.load_gamesets()["2"]["20"]["members"]["a"] == 5
+    assert data_manager.find_unfinished_archive() == archive_file
+
+    # 起動時に書き戻しをやり直し、アーカイブ済みのゲームセットを二重に集計しない
+    manager = gameset_manager()
+    assert data_manager.find_unfinished_archive() is None
+    assert not manager.is_active("1", "10", "A")
+    assert manager.get_current_scores("2", "20")[2][0] == ("a", 5)
+    expected = manager.get_season_standings("1", "今月")
+    assert expected[2][0] == ("a", 30, 1, [1, 0, 0, 0])
+
+    manager.end_gameset("2", "20")
+    assert len(data_manager.list_archive_files()) == 2
+    assert gameset_manager().get_season_standings("1", "今月") == expected
+    season = manager.seasons["1"]["今月"]
+    manager.define_season("1", "今月", season.start.isoformat(), season.end.isoformat())
+    assert manager.get_season_standings("1", "今月") == expected
+
+
+def test_manager_rejects_unknown_durability():
+    from app.core.gameset_manager import GamesetManager
+
+    with pytest.raises(ValueError):
+        GamesetManager(durability="never")
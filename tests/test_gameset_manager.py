@@ -1,3 +1,4 @@
+import glob
 import os
 from unittest.mock import patch
 
@@ -26,9 +27,11 @@ def setup_teardown():
 
         yield gameset_manager
 
-    # テスト終了後にテスト用ファイルを削除
+    # テスト終了後にテスト用ファイルとアーカイブを削除
     if os.path.exists(TEST_DATA_FILE):
         os.remove(TEST_DATA_FILE)
+    for path in glob.glob("test_gamesets.*.json"):
+        os.remove(path)
 
 
 @pytest.mark.asyncio
@@ -395,3 +398,44 @@ async def test_end_gameset_logic(setup_teardown):
     )
     assert gameset_manager.current_gamesets[guild_id][channel_id]["games"] == []
     assert gameset_manager.current_gamesets[guild_id][channel_id]["members"] == {}
+
+
+def test_close_idle_gamesets(setup_teardown):
+    gameset_manager = setup_teardown
+    guild_id = "123"
+
+    # 更新時刻のない古いデータは、最初の検索時点から計測する
+    gameset_manager.current_gamesets[guild_id] = {
+        "1": {"status": "active", "games": [], "members": {}},
+        "2": {"status": "inactive", "games": [], "members": {}},
+    }
+    assert gameset_manager.find_idle_gamesets(3600) == []
+    legacy_updated_at = gameset_manager.current_gamesets[guild_id]["1"]["updated_at"]
+
+    gameset_manager.start_gameset(guild_id, "3")
+    gameset_manager.record_game(
+        guild_id, "3", "hanchan", 3, "a:100,b:0,c:-100", "jantama"
+    )
+    updated_at = gameset_manager.current_gamesets[guild_id]["3"]["updated_at"]
+    assert updated_at >= legacy_updated_at
+
+    now = updated_at + 3600
+    assert gameset_manager.find_idle_gamesets(3600, now) == [
+        (guild_id, "1"),
+        (guild_id, "3"),
+    ]
+
+    # 1件ずつ閉じる
+    assert gameset_manager.close_idle_gamesets(3600, 1, now) == [(guild_id, "1", None)]
+    assert gameset_manager.close_idle_gamesets(3600, 1, now) == [
+        (guild_id, "3", [("a", 100), ("b", 0), ("c", -100)])
+    ]
+    assert gameset_manager.close_idle_gamesets(3600, 1, now) == []
+    assert gameset_manager.current_gamesets[guild_id]["3"]["status"] == "inactive"
+    assert gameset_manager.current_gamesets[guild_id]["3"]["members"] == {}
+
+    # 閉じた後に開始したゲームセットは新しい更新時刻で計測される
+    gameset_manager.start_gameset(guild_id, "1")
+    assert gameset_manager.find_idle_gamesets(3600) == []
+    assert gameset_manager.end_gameset(guild_id, "1")[0] is True
+    assert gameset_manager.find_idle_gamesets(0, now + 3600) == []
@@ -0,0 +1,179 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.player_index import (
+    PlayerNameIndex,
+    build_scores_completions,
+    split_scores_input,
+)
+from app.discord_bot.player_history import index_player_history
+
+ARCHIVE_FILE = "gamesets.20240101000000.json"
+
+
+def test_player_name_index_search():
+    index = PlayerNameIndex()
+    index.add("1", "Alice")
+    index.add("1", "alfred")
+    index.add("1", "Bob")
+    index.add("1", "Alice")  # 重複は無視される
+    index.add("1", "")
+    index.add("2", "Alan")
+
+    assert len(index) == 4
+    assert index.search("1", "al") == [("alfred", "alfred"), ("Alice", "Alice")]
+    assert index.search("1", "AL", limit=1) == [("alfred", "alfred")]
+    assert [name for name, _ in index.search("1", "")] == ["alfred", "Alice", "Bob"]
+    assert index.search("1", "c") == []
+    assert index.search("1", "al", limit=0) == []
+    assert index.search("3", "a") == []
+
+    # メンバーとして登録された名前は、メンションを入力する候補に置き換わる
+    index.add("1", "Alice", "<@123>")
+    assert index.search("1", "ali") == [("Alice", "<@123>")]
+    assert len(index) == 4
+
+
+def test_player_name_index_add_many():
+    index = PlayerNameIndex()
+    index.add("1", "bob")
+    index.add("1", "Alice")
+    index.add_many(
+        "1",
+        [
+            ("carol", None),
+            ("Alice", "<@1>"),
+            ("alfred", None),
+            ("", None),
+            ("bob", None),
+        ],
+    )
+
+    assert len(index) == 4
+    assert index.search("1", "") == [
+        ("alfred", "alfred"),
+        ("Alice", "<@1>"),
+        ("bob", "bob"),
+        ("carol", "carol"),
+    ]
+    # まとめて追加した結果は、1件ずつ追加した場合と同じ順序になる
+    expected = PlayerNameIndex()
+    names = [f"member{i % 997}-{i}" for i in range(5000)]
+    for name in names:
+        expected.add("1", name)
+    index.add_many("1", ((name, None) for name in names))
+    assert [name for name, _ in index.search("1", "member", limit=6000)] == [
+        name for name, _ in expected.search("1", "member", limit=6000)
+    ]
+
+
+def test_register_members_indexes_in_bulk(manager):
+    manager.register_members(
+        [
+            ("1", user_id, f"member{user_id}", [f"nick{user_id}"])
+            for user_id in range(1000)
+        ]
+    )
+
+    assert len(manager.player_index) == 2000
+    assert manager.search_player_names("1", "member999") == [("member999", "<@999>")]
+    assert manager.search_player_names("1", "nick10", limit=2) == [
+        ("nick10", "<@10>"),
+        ("nick100", "<@100>"),
+    ]
+
+
+def test_split_scores_input():
+    assert split_scores_input("") == ("", "")
+    assert split_scores_input("@al") == ("", "al")
+    assert split_scores_input("alice:25000,@bo") == ("alice:25000, ", "bo")
+    assert split_scores_input("alice:25000") == ("alice:25000", None)
+
+
+def test_build_scores_completions():
+    assert build_scores_completions(
+        "alice:25000,b", [("bob", "<@1>"), ("bobby", "bobby")]
+    ) == [
+        ("alice:25000, bob", "alice:25000, <@1>:"),
+        ("alice:25000, bobby", "alice:25000, bobby:"),
+    ]
+    # Discord の選択肢は名前・値ともに100文字まで
+    assert build_scores_completions(
+        "b", [("b" * 101, "b"), ("b", "b" * 100), ("bob", "bob")]
+    ) == [("bob", "bob:")]
+
+
+@pytest.mark.asyncio
+async def test_gameset_manager_indexes_players(gameset_manager):
+    with open("gamesets.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {"1": {"10": {"status": "active", "games": [], "members": {"Dan": 0}}}},
+            f,
+        )
+    with open(ARCHIVE_FILE, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "1": {
+                    "10": {
+                        "status": "inactive",
+                        "games": [],
+                        "members": {
+                            "Dave": 0,
+                            "Doris": 0,
+                            "123456789012345678": 0,
+                            "223456789012345678": 0,
+                        },
+                    }
+                }
+            },
+            f,
+        )
+
+    manager = gameset_manager()
+    manager.register_member("1", 123456789012345678, "Dora", ["dora_user"])
+    manager.register_member("1", 323456789012345678, "Doris", [])
+    # 過去のプレイヤーは、起動後にバックグラウンドで追加される
+    assert manager.search_player_names("1", "da") == []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert await index_player_history(manager, 1, executor) == 1
+    assert manager.search_player_names("1", "d") == [
+        ("Dan", "Dan"),
+        ("Dave", "Dave"),
+        ("Dora", "<@123456789012345678>"),
+        ("dora_user", "<@123456789012345678>"),
+        # メンバーの名前と一致する過去のプレイヤーは、メンバーとして補完する
+        ("Doris", "<@323456789012345678>"),
+    ]
+
+    manager.register_member("1", 423456789012345678, "Daisy", [])
+    manager.start_gameset("1", "10")
+    manager.record_game("1", "10", "hanchan", 3, "@Dara:100,Dan:0,Ed:-100", "tenhou")
+    assert [name for name, _ in manager.search_player_names("1", "da")] == [
+        "Daisy",
+        "Dan",
+        "Dara",
+        "Dave",
+    ]
+    assert manager.search_player_names("1", "e") == [("Ed", "Ed")]
+
+
+@pytest.mark.asyncio
+async def test_gameset_manager_skips_broken_archive(gameset_manager):
+    with open(ARCHIVE_FILE, "w", encoding="utf-8") as f:
+        f.write("{broken")
+
+    manager = gameset_manager()
+    assert await index_player_history(manager) == 1
+    assert manager.search_player_names("1", "") == []
+
+
+def test_search_does_not_wait_for_commands(manager):
+    manager.register_member("1", 123456789012345678, "Dora", [])
+
+    # コマンドの実行中 (マネージャーのロックを保持している間) も補完候補を検索できる
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with manager.lock:
+            future = executor.submit(manager.search_player_names, "1", "do")
+            assert future.result(timeout=5) == [("Dora", "<@123456789012345678>")]
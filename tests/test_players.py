@@ -0,0 +1,242 @@
+import json
+
+from app.core.players import (
+    format_player,
+    normalize_gameset_players,
+    parse_player,
+)
+
+USER_ID = 123456789012345678
+OTHER_USER_ID = 223456789012345678
+
+
+def test_parse_player():
+    assert parse_player(f" <@{USER_ID}> ") == USER_ID
+    assert parse_player(f"<@!{USER_ID}>") == USER_ID
+    assert parse_player(f"@{USER_ID}") == USER_ID
+    assert parse_player("@guest") == "guest"
+    assert parse_player("12345") == "12345"
+    assert parse_player("alice", {"alice": USER_ID}) == USER_ID
+
+
+def test_format_player():
+    assert format_player(USER_ID) == f"<@{USER_ID}>"
+    assert format_player("guest") == "guest"
+
+
+def test_normalize_gameset_players():
+    gameset_data = {
+        "games": [
+            {"scores": {"alice": 100, "guest": -100}},
+            {"scores": {str(USER_ID): 50, "guest": -50}},
+            {"scores": {USER_ID: 10, OTHER_USER_ID: -10}},
+        ],
+        "members": {"alice": 100, "guest": -150, str(USER_ID): 60},
+    }
+    assert normalize_gameset_players(gameset_data, {"alice": USER_ID}) is True
+    # 名前とユーザーIDで別々に記録されていたスコアはまとめられる
+    assert gameset_data["members"] == {USER_ID: 160, "guest": -150}
+    assert [game["scores"] for game in gameset_data["games"]] == [
+        {USER_ID: 100, "guest": -100},
+        {USER_ID: 50, "guest": -50},
+        {USER_ID: 10, OTHER_USER_ID: -10},
+    ]
+    assert normalize_gameset_players(gameset_data, {"alice": USER_ID}) is False
+    assert normalize_gameset_players({"games": [], "members": {"guest": 0}}) is False
+
+
+def test_record_game_with_mentions(gameset_manager):
+    manager = gameset_manager()
+    manager.register_member("1", OTHER_USER_ID, "Bob", ["bob_user"])
+    manager.start_gameset("1", "10")
+
+    success, _, sorted_scores = manager.record_game(
+        "1",
+        "10",
+        "hanchan",
+        3,
+        f"<@{USER_ID}>:100, bob_user:0, guest:-100",
+        "jantama",
+    )
+    assert success is True
+    assert sorted_scores == [(USER_ID, 100), (OTHER_USER_ID, 0), ("guest", -100)]
+
+    success, message, _ = manager.record_game(
+        "1", "10", "hanchan", 3, f"<@{USER_ID}>:100,<@!{USER_ID}>:0,c:-100", "tenhou"
+    )
+    assert success is False
+    assert message == (
+        f"プレイヤー名 '<@{USER_ID}>' が重複しています。"
+        "異なるプレイヤー名を入力してください。"
+    )
+
+    # 保存後もユーザーIDのキーは整数として読み込まれる
+    reloaded = gameset_manager()
+    assert reloaded.get_current_scores("1", "10")[2] == sorted_scores
+
+
+def test_name_keyed_data_is_migrated(gameset_manager):
+    with open("gamesets.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "1": {
+                    "10": {
+                        "status": "active",
+                        "games": [
+                            {
+                                "rule": "hanchan",
+                                "players_count": 3,
+                                "scores": {"alice": 100, "bob": 0, "guest": -100},
+                                "service": "jantama",
+                            }
+                        ],
+                        "members": {"alice": 100, "bob": 0, "guest": -100},
+                    }
+                }
+            },
+            f,
+        )
+
+    manager = gameset_manager()
+    manager.register_member("1", USER_ID, "Alice", ["alice"])
+    manager.register_member("1", OTHER_USER_ID, "Bob", ["bob"])
+    manager.record_game(
+        "1", "10", "hanchan", 3, f"<@{USER_ID}>:50,Bob:0,guest:-50", "jantama"
+    )
+
+    assert manager.get_current_scores("1", "10")[2] == [
+        (USER_ID, 150),
+        (OTHER_USER_ID, 0),
+        ("guest", -150),
+    ]
+    assert manager.current_gamesets["1"]["10"]["games"][0]["scores"] == {
+        USER_ID: 100,
+        OTHER_USER_ID: 0,
+        "guest": -100,
+    }
+
+
+def test_data_used_before_members_are_registered_is_migrated(gameset_manager):
+    manager = gameset_manager()
+    manager.start_gameset("1", "10")
+    manager.record_game("1", "10", "hanchan", 3, "alice:100,bob:0,guest:-100", "tenhou")
+    assert manager.get_standings("1", "10")[2] == [
+        ("alice", 100),
+        ("bob", 0),
+        ("guest", -100),
+    ]
+
+    # メンバーが登録された後に使う時点で、名前で記録したプレイヤーを移行する
+    manager.register_member("1", USER_ID, "Alice", ["alice"])
+    assert manager.get_current_scores("1", "10")[2] == [
+        (USER_ID, 100),
+        ("bob", 0),
+        ("guest", -100),
+    ]
+    manager.register_member("1", OTHER_USER_ID, "Bob", ["bob"])
+    manager.record_game(
+        "1", "10", "hanchan", 3, f"<@{USER_ID}>:50,Bob:0,guest:-50", "tenhou"
+    )
+    assert manager.get_standings("1", "10")[2] == [
+        (USER_ID, 150),
+        (OTHER_USER_ID, 0),
+        ("guest", -150),
+    ]
+
+
+def test_member_ids_are_persisted(gameset_manager):
+    manager = gameset_manager()
+    manager.register_members(
+        [("1", USER_ID, "Alice", ["alice"]), ("1", OTHER_USER_ID, "Bob", [])]
+    )
+
+    # 再起動後も、メンバーの登録前に名前で入力されたプレイヤーをユーザーIDで記録する
+    reloaded = gameset_manager()
+    assert reloaded.member_ids == {
+        "1": {"Alice": USER_ID, "alice": USER_ID, "Bob": OTHER_USER_ID}
+    }
+    reloaded.start_gameset("1", "10")
+    success, _, _ = reloaded.record_game(
+        "1", "10", "hanchan", 3, "alice:100,Bob:0,guest:-100", "tenhou"
+    )
+    assert success
+    assert reloaded.get_current_scores("1", "10")[2] == [
+        (USER_ID, 100),
+        (OTHER_USER_ID, 0),
+        ("guest", -100),
+    ]
+
+
+def test_duplicate_names_are_recorded_as_guests(manager):
+    manager.register_members(
+        [("1", USER_ID, "Alice", ["alice"]), ("1", OTHER_USER_ID, "Alice", ["bob"])]
+    )
+
+    # 同じ表示名のメンバーが複数いる場合、名前だけではどちらか決められない
+    assert manager.member_ids["1"] == {"alice": USER_ID, "bob": OTHER_USER_ID}
+    assert manager.search_player_names("1", "Alice") == [
+        ("Alice", "Alice"),
+        ("alice", f"<@{USER_ID}>"),
+    ]
+    manager.start_gameset("1", "10")
+    manager.record_game("1", "10", "hanchan", 3, "Alice:100,bob:0,guest:-100", "tenhou")
+    assert manager.get_current_scores("1", "10")[2] == [
+        ("Alice", 100),
+        (OTHER_USER_ID, 0),
+        ("guest", -100),
+    ]
+
+    # 一方が表示名を変えると、残ったメンバーの名前になる
+    manager.register_member("1", OTHER_USER_ID, "Bobby", ["bob"])
+    assert manager.member_ids["1"]["Alice"] == USER_ID
+    assert manager.search_player_names("1", "Alice", limit=1) == [
+        ("Alice", f"<@{USER_ID}>")
+    ]
+
+
+def test_renamed_and_removed_members_release_their_names(manager):
+    manager.register_members(
+        [("1", USER_ID, "Alice", ["alice"]), ("1", OTHER_USER_ID, "Bob", ["bob"])]
+    )
+
+    # 以前の表示名は、その後に入力されてもゲストとして記録する
+    manager.register_member("1", USER_ID, "Alicia", ["alice"])
+    assert manager.member_ids["1"] == {
+        "Alicia": USER_ID,
+        "alice": USER_ID,
+        "Bob": OTHER_USER_ID,
+        "bob": OTHER_USER_ID,
+    }
+    assert manager.search_player_names("1", "Ali") == [
+        ("alice", f"<@{USER_ID}>"),
+        ("Alicia", f"<@{USER_ID}>"),
+    ]
+
+    manager.unregister_member("1", OTHER_USER_ID)
+    assert "bob" not in manager.member_ids["1"]
+    assert manager.search_player_names("1", "b") == []
+
+    # 起動時にメンバーの一覧で置き換えると、停止中に抜けたメンバーの名前も外す
+    manager.register_member("1", OTHER_USER_ID, "Bob", ["bob"])
+    manager.register_members([("1", OTHER_USER_ID, "Bob", ["bob"])], replace=True)
+    assert manager.member_ids["1"] == {"Bob": OTHER_USER_ID, "bob": OTHER_USER_ID}
+    assert manager.members == {"1": {OTHER_USER_ID: ["Bob", "bob"]}}
+
+
+def test_members_file_from_previous_version(gameset_manager):
+    # 以前の形式 { 名前: ユーザーID } で保存されたファイルも読み込める
+    with open("members.json", "w") as f:
+        json.dump({"1": {"Alice": USER_ID, "alice": USER_ID, "Bob": OTHER_USER_ID}}, f)
+
+    manager = gameset_manager()
+    assert manager.members == {
+        "1": {USER_ID: ["Alice", "alice"], OTHER_USER_ID: ["Bob"]}
+    }
+    manager.register_member("1", OTHER_USER_ID, "Robert", [])
+    with open("members.json") as f:
+        assert json.load(f) == {
+            "1": {str(USER_ID): ["Alice", "alice"], str(OTHER_USER_ID): ["Robert"]}
+        }
+    assert gameset_manager().member_ids == {
+        "1": {"Alice": USER_ID, "alice": USER_ID, "Robert": OTHER_USER_ID}
+    }
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import data_manager
+from app.discord_bot.reaper import format_idle_summary, reap_idle_gamesets
+
+
+@pytest.fixture
+def manager(manager):
+    for channel_id in ("1", "2", "3"):
+        manager.start_gameset("10", channel_id)
+        manager.record_game(
+            "10", channel_id, "hanchan", 3, "a:100,b:0,c:-100", "jantama"
+        )
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_reap_idle_gamesets_in_batches(manager):
+    closed = []
+    archives = []
+
+    async def on_closed(result):
+        closed.append(result)
+        archives.append(len(data_manager.list_archive_files()))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        count = await reap_idle_gamesets(manager, 0, 2, on_closed, executor=executor)
+
+    assert count == 3
+    assert [channel_id for _, channel_id, _ in closed] == ["1", "2", "3"]
+    # バッチに分けて閉じても、アーカイブは巡回の最後に1つだけ作成される
+    assert archives == [0, 0, 0]
+    [archive_file] = data_manager.list_archive_files()
+    archived = data_manager.load_archive(archive_file)["10"]
+    assert [archived[key]["members"]["a"] for key in ("1", "2", "3")] == [100] * 3
+    assert all(
+        gameset_data["games"] == []
+        for gameset_data in data_manager.load_gamesets()["10"].values()
+    )
+
+    assert await reap_idle_gamesets(manager, 0, 2) == 0
+    assert len(data_manager.list_archive_files()) == 1
+
+
+@pytest.mark.asyncio
+async def test_reap_idle_gamesets_keeps_recent_gamesets(manager):
+    assert await reap_idle_gamesets(manager, 3600, 10) == 0
+    assert manager.current_gamesets["10"]["1"]["status"] == "active"
+
+
+def test_pending_gamesets_are_archived_before_restart(gameset_manager, manager):
+    manager.close_idle_gamesets(0, 1, archive=False)
+    assert data_manager.list_archive_files() == []
+
+    # 同じチャンネルで新しく開始する場合は、保留中のゲームセットを先にアーカイブする
+    manager.start_gameset("10", "1")
+    [archive_file] = data_manager.list_archive_files()
+    assert data_manager.load_archive(archive_file)["10"]["1"]["members"]["a"] == 100
+
+    # アーカイブする前に異常終了したゲームセットは、次のアーカイブに含めて空にする
+    manager.close_idle_gamesets(0, 1, archive=False)
+    reloaded = gameset_manager()
+    assert reloaded.current_gamesets["10"]["2"]["games"] != []
+    reloaded.end_gameset("10", "3")
+    archive_file = data_manager.list_archive_files()[-1]
+    assert data_manager.load_archive(archive_file)["10"]["2"]["members"]["a"] == 100
+    assert gameset_manager().current_gamesets["10"]["2"]["games"] == []
+
+
+def test_format_idle_summary():
+    assert format_idle_summary(None, 24) is None
+    message = format_idle_summary([(123, 100), ("b", -100)], 1.5)
+    assert message is not None
+    assert message.startswith("## 麻雀ゲームセット結果\n1.5時間更新がなかったため、")
+    assert message.endswith("- <@123>: 100 (1位)\n- b: -100 (2位)\n")
+
+    message = format_idle_summary([("a", 0)], 24, "A")
+    assert message is not None
+    assert message.startswith("## 麻雀ゲームセット結果 (卓: A)\n24時間")
@@ -0,0 +1,159 @@
+from datetime import date, datetime, timedelta
+
+from app.core import data_manager
+from app.core.season import (
+    Season,
+    SeasonStandings,
+    archive_timestamp,
+    parse_channels,
+    rebuild_from_archives,
+)
+
+TODAY = date.today()
+START = (TODAY - timedelta(days=1)).isoformat()
+END = (TODAY + timedelta(days=1)).isoformat()
+
+
+def record(manager, channel_id, scores, table=None):
+    success, message, _ = manager.record_game(
+        "1", channel_id, "hanchan", 4, scores, "jantama", table
+    )
+    assert success, message
+
+
+def test_season_standings():
+    standings = SeasonStandings()
+    standings.add_game({"a": 30, "b": 10, "c": -10, "d": -30})
+    standings.add_game({"a": -30, "b": 30, "c": 0, "d": 0})
+    assert standings.rows()["a"] == (0, 2, [1, 0, 0, 1])
+    assert standings.rows()["c"] == (-10, 2, [0, 1, 1, 0])
+
+    standings.remove_game({"a": -30, "b": 30, "c": 0, "d": 0})
+    assert standings.rows()["b"] == (10, 1, [0, 1, 0, 0])
+
+    restored = SeasonStandings.from_dict(standings.to_dict())
+    assert restored.rows() == standings.rows()
+    standings.merge(restored)
+    assert standings.rows()["a"] == (60, 2, [2, 0, 0, 0])
+
+    standings.remove_game({"a": 30, "b": 10, "c": -10, "d": -30})
+    standings.remove_game({"a": 30, "b": 10, "c": -10, "d": -30})
+    assert len(standings) == 0
+
+
+def test_season_definition():
+    season = Season("4月", date(2024, 4, 1), date(2024, 4, 30), ["10", "20", "10"])
+    assert season.channels == ["10", "20"]
+    assert season.includes("10", datetime(2024, 4, 30, 23, 59).timestamp())
+    assert not season.includes("10", datetime(2024, 5, 1).timestamp())
+    assert not season.includes("30", datetime(2024, 4, 10).timestamp())
+    assert Season("全体", date(2024, 4, 1), date(2024, 4, 30)).includes(
+        "30", datetime(2024, 4, 10).timestamp()
+    )
+
+    restored = Season.from_dict("4月", season.to_dict())
+    assert (restored.start, restored.end, restored.channels) == (
+        season.start,
+        season.end,
+        season.channels,
+    )
+    assert parse_channels("<#10>, 20 <#30>") == ["10", "20", "30"]
+    assert parse_channels(None) == []
+    assert archive_timestamp("gamesets.20240401123000.json") == (
+        datetime(2024, 4, 1, 12, 30).timestamp()
+    )
+    assert archive_timestamp("gamesets.json") is None
+
+
+def test_season_is_updated_incrementally(gameset_manager, manager):
+    success, message = manager.define_season("1", "今月", START, END, "<#10>")
+    assert success, message
+    assert manager.list_seasons("1") == ["今月"]
+    assert manager.get_season_standings("1", "今月")[0] is False
+
+    manager.start_gameset("1", "10")
+    manager.start_gameset("1", "20")
+    record(manager, "10", "a:30, b:10, c:-10, d:-30")
+    record(manager, "20", "a:100, b:0, c:0, d:-100")
+
+    success, _, ranking = manager.get_season_standings("1", "今月")
+    assert success is True
+    assert ranking[0] == ("a", 30, 1, [1, 0, 0, 0])
+
+    # 破棄したゲームセットは集計から外す
+    manager.start_gameset("1", "10")
+    assert manager.get_season_standings("1", "今月")[0] is False
+
+    # 別の卓のゲームも、同じチャンネルであれば集計する
+    manager.start_gameset("1", "10", "B")
+    record(manager, "10", "a:10, b:-10, c:0, d:0")
+    record(manager, "10", "a:-10, b:10, c:0, d:0", table="B")
+    manager.end_gameset("1", "10")
+
+    _, _, ranking = manager.get_season_standings("1", "今月")
+    assert {row[0]: row[1:] for row in ranking}["a"] == (0, 2, [1, 0, 0, 1])
+
+    # 終了したゲームセットの集計は保存され、進行中のゲームセットは現在の状態から集計する
+    reloaded = gameset_manager()
+    assert reloaded.get_season_standings("1", "今月") == manager.get_season_standings(
+        "1", "今月"
+    )
+    assert manager.get_season_standings("1", "来月")[0] is False
+
+
+def test_define_season_validates_dates(manager):
+    assert manager.define_season("1", "x", "2024/04/01", END)[0] is False
+    assert manager.define_season("1", "x", END, START)[0] is False
+    assert manager.list_seasons("1") == []
+
+
+def test_season_is_rebuilt_from_archives(manager):
+    for channel_id, scores in [
+        ("10", "a:30, b:10, c:-10, d:-30"),
+        ("20", "a:-30, b:10, c:10, d:10"),
+        ("10", "a:5, b:-5, c:0, d:0"),
+    ]:
+        manager.start_gameset("1", channel_id)
+        record(manager, channel_id, scores)
+        manager.end_gameset("1", channel_id)
+    manager.start_gameset("1", "20")
+    record(manager, "20", "a:1, b:-1, c:0, d:0")
+
+    # 定義を登録した時点で、アーカイブと進行中のゲームセットから集計する
+    success, message = manager.define_season("1", "今月", START, END)
+    assert success, message
+    _, _, ranking = manager.get_season_standings("1", "今月")
+    assert ranking[0] == ("b", 14, 4, [1, 1, 0, 2])
+    assert {row[0]: row[1:] for row in ranking}["a"] == (6, 4, [3, 0, 0, 1])
+
+    # 定義を変更すると作り直す
+    manager.define_season("1", "今月", START, END, "10")
+    _, _, ranking = manager.get_season_standings("1", "今月")
+    assert ranking[0] == ("a", 35, 2, [2, 0, 0, 0])
+
+    paths = data_manager.list_archive_files()
+    season = manager.seasons["1"]["今月"]
+    parallel = rebuild_from_archives(paths, "1", season, workers=2)
+    assert parallel.rows() == season.final.rows()
+
+
+def test_define_season_includes_archives_created_during_rebuild(manager, monkeypatch):
+    from app.core import gameset_manager as gameset_manager_module
+
+    manager.start_gameset("1", "10")
+    record(manager, "10", "a:30, b:10, c:-10, d:-30")
+
+    def rebuild_while_ending(*args, **kwargs):
+        standings = rebuild_from_archives(*args, **kwargs)
+        # 集計中 (ロックを解放している間) に別のコマンドがゲームセットを終了する
+        manager.end_gameset("1", "10")
+        return standings
+
+    monkeypatch.setattr(
+        gameset_manager_module, "rebuild_from_archives", rebuild_while_ending
+    )
+    success, message = manager.define_season("1", "今月", START, END)
+    assert success, message
+    assert "1件のアーカイブ" in message
+    _, _, ranking = manager.get_season_standings("1", "今月")
+    assert ranking[0] == ("a", 30, 1, [1, 0, 0, 0])
@@ -0,0 +1,160 @@
+import json
+
+import pytest
+
+from app.core import data_manager
+from app.core.snapshot import (
+    LazyChannels,
+    SnapshotFormatError,
+    encode_snapshot,
+    load_snapshot,
+    scan_channels,
+    write_snapshot,
+)
+
+GAMESETS = {
+    "1": {
+        "10": {"status": "active", "games": [], "members": {"プレイヤー": 100}},
+        "11": {"status": "inactive", "games": [], "members": {}},
+    },
+    "2": {"20": {"status": "active", "games": [{"rule": "tonpu"}], "members": {}}},
+}
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "gamesets.snapshot")
+    write_snapshot(path, GAMESETS)
+
+    loaded = load_snapshot(path)
+    assert isinstance(loaded["1"], LazyChannels)
+    assert json.loads(json.dumps(loaded, default=dict)) == GAMESETS
+    assert not (tmp_path / "gamesets.snapshot.tmp").exists()
+
+
+def test_lazy_channels_decode_on_access(tmp_path):
+    path = str(tmp_path / "gamesets.snapshot")
+    write_snapshot(path, GAMESETS)
+    channels = load_snapshot(path)["1"]
+
+    assert len(channels) == 2
+    assert "10" in channels and "99" not in channels
+    assert channels._decoded == {}
+
+    gameset_data = channels["10"]
+    assert channels["10"] is gameset_data
+    assert list(channels._decoded) == ["10"]
+
+    # 変更したチャンネルは再エンコードされ、未変更のチャンネルはそのまま書き出される
+    gameset_data["members"]["プレイヤー"] = 200
+    channels.mark_dirty("10")
+    channels["12"] = {"status": "active", "games": [], "members": {}}
+    del channels["11"]
+    assert sorted(channels) == ["10", "12"]
+    del channels["12"]
+    with pytest.raises(KeyError):
+        channels["12"]
+
+    write_snapshot(path, {"1": channels, "2": {}})
+    reloaded = load_snapshot(path)
+    assert dict(reloaded["1"]) == {
+        "10": {"status": "active", "games": [], "members": {"プレイヤー": 200}}
+    }
+    assert "2" not in reloaded
+
+
+def test_only_changed_channels_are_encoded(tmp_path):
+    path = str(tmp_path / "gamesets.snapshot")
+    write_snapshot(path, GAMESETS)
+    gamesets = load_snapshot(path)
+    gamesets["3"] = LazyChannels.from_dict({"30": GAMESETS["1"]["11"]})
+    for channel_id in ("10", "11"):
+        gamesets["1"][channel_id]
+
+    encoded = []
+
+    def encode(gameset_data):
+        encoded.append(gameset_data)
+        return json.dumps(gameset_data).encode("utf-8")
+
+    # 読み込んだまま変更していないチャンネルは、元のバイト列を書き出す
+    first = b"".join(encode_snapshot(gamesets, encode))
+    assert encoded == [GAMESETS["1"]["11"]]
+    assert b"".join(encode_snapshot(gamesets, encode)) == first
+    assert len(encoded) == 1
+
+    gamesets["1"]["10"]["status"] = "inactive"
+    gamesets["1"].mark_dirty("10")
+    encode_snapshot(gamesets, encode)
+    encode_snapshot(gamesets, encode)
+    assert encoded[1:] == [gamesets["1"]["10"]]
+
+
+def test_scan_does_not_keep_decoded_channels(tmp_path):
+    path = str(tmp_path / "gamesets.snapshot")
+    write_snapshot(path, GAMESETS)
+    channels = load_snapshot(path)["1"]
+
+    gameset_data = channels["10"]
+    assert dict(scan_channels(channels)) == GAMESETS["1"]
+    assert channels.peek("11") == GAMESETS["1"]["11"]
+    # 走査中は復元済みのチャンネルをそのまま返し、未復元のチャンネルは保持しない
+    assert dict(channels.scan_items())["10"] is gameset_data
+    assert list(channels._decoded) == ["10"]
+    assert json.loads(data_manager.get_codec().encode({"1": channels})) == {
+        "1": GAMESETS["1"]
+    }
+    assert list(channels._decoded) == ["10"]
+
+
+def test_startup_indexing_decodes_only_active_channels(monkeypatch, gameset_manager):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", "snapshot")
+    write_snapshot("gamesets.snapshot", GAMESETS)
+    manager = gameset_manager()
+
+    manager.index_current_gamesets(manager.current_guild_ids())
+    assert manager.search_player_names("1", "プ") == [("プレイヤー", "プレイヤー")]
+    assert manager.current_gamesets["1"]._decoded == {}
+
+    # 更新時刻のない進行中のゲームセットのみ、更新時刻を記録するために復元する
+    assert manager.find_idle_gamesets(3600) == []
+    assert list(manager.current_gamesets["1"]._decoded) == ["10"]
+    assert list(manager.current_gamesets["2"]._decoded) == ["20"]
+
+
+def test_load_snapshot_rejects_invalid_files(tmp_path):
+    path = tmp_path / "gamesets.snapshot"
+    path.write_bytes(b"")
+    with pytest.raises(SnapshotFormatError):
+        load_snapshot(str(path))
+
+    path.write_bytes(b"{" * 32)
+    with pytest.raises(SnapshotFormatError):
+        load_snapshot(str(path))
+
+    write_snapshot(str(path), GAMESETS)
+    path.write_bytes(path.read_bytes()[:-10])
+    with pytest.raises(SnapshotFormatError):
+        load_snapshot(str(path))
+
+    # インデックスの途中で切れたファイル
+    write_snapshot(str(path), GAMESETS)
+    path.write_bytes(path.read_bytes()[:20])
+    with pytest.raises(SnapshotFormatError):
+        load_snapshot(str(path))
+
+
+def test_lazy_channels_keep_corrupt_channels(tmp_path):
+    path = str(tmp_path / "gamesets.snapshot")
+    write_snapshot(path, GAMESETS)
+
+    def broken_decode(data):
+        raise ValueError("corrupt")
+
+    channels = load_snapshot(path, broken_decode)["1"]
+    with pytest.raises(ValueError):
+        channels["10"]
+    # 復元に失敗しても、チャンネルは消えずに残る
+    assert "10" in channels and len(channels) == 2
+
+    channels._decode = json.loads
+    assert channels["10"] == GAMESETS["1"]["10"]
@@ -0,0 +1,131 @@
+from app.core import data_manager
+from app.core.gameset_manager import gameset_key, split_gameset_key
+from app.core.tournament import TournamentStandings
+
+
+def test_tournament_standings():
+    standings = TournamentStandings()
+    standings.add_table({"a": 100, "b": -100})
+    standings.add_table({"a": -50, "c": 50})
+    assert len(standings) == 3
+    assert standings.ranking() == [("a", 50), ("c", 50), ("b", -100)]
+
+    standings.add_score("d", 0, True)
+    standings.remove_table({"a": 100, "b": -100})
+    assert standings.ranking() == [("c", 50), ("d", 0), ("a", -50)]
+
+
+def test_gameset_key():
+    assert gameset_key("1") == "1"
+    assert gameset_key("1", " ") == "1"
+    assert gameset_key("1", "A卓") == "1#A卓"
+    assert split_gameset_key("1") == ("1", None)
+    assert split_gameset_key("1#A#B") == ("1", "A#B")
+
+
+def test_tables_are_independent(manager):
+    manager.start_gameset("10", "1")
+    manager.start_gameset("10", "1", "A")
+    manager.start_gameset("10", "1", "B")
+    manager.start_gameset("10", "2", "A")
+    assert manager.is_active("10", "1", "A")
+    assert not manager.is_active("10", "1", "C")
+    assert not manager.is_active("20", "1")
+    assert manager.list_tables("10", "1") == ["A", "B"]
+
+    manager.record_game("10", "1", "hanchan", 3, "a:100,b:0,c:-100", "tenhou")
+    manager.record_game("10", "1", "hanchan", 3, "a:-30,d:10,e:20", "tenhou", "A")
+    manager.record_game("10", "1", "hanchan", 3, "a:-30,d:10,e:20", "tenhou", "A")
+    manager.record_game("10", "2", "hanchan", 3, "x:1,y:0,z:-1", "tenhou", "A")
+
+    assert manager.get_current_scores("10", "1", "A")[2] == [
+        ("e", 40),
+        ("d", 20),
+        ("a", -60),
+    ]
+    assert manager.get_current_scores("10", "1")[2] == [
+        ("a", 100),
+        ("b", 0),
+        ("c", -100),
+    ]
+    assert manager.get_current_scores("10", "1", "B")[1] == (
+        "まだゲームが記録されていません。"
+    )
+    assert manager.get_standings("10", "1") == (
+        True,
+        "全卓のトータルスコア",
+        [("a", 40), ("e", 40), ("d", 20), ("b", 0), ("c", -100)],
+    )
+
+    # 卓を終了すると順位表から外れ、他の卓には影響しない
+    success, _, sorted_scores = manager.end_gameset("10", "1", "A")
+    assert success is True
+    assert sorted_scores == [("e", 40), ("d", 20), ("a", -60)]
+    assert manager.list_tables("10", "1") == ["B"]
+    assert manager.get_standings("10", "1")[2] == [
+        ("a", 100),
+        ("b", 0),
+        ("c", -100),
+    ]
+    assert manager.get_current_scores("10", "2", "A")[0] is True
+
+    # 既存の卓を破棄して開始し直した場合も順位表から外れる
+    manager.start_gameset("10", "1")
+    assert manager.get_standings("10", "1") == (
+        False,
+        "まだゲームが記録されていません。",
+        None,
+    )
+
+
+def test_standings_are_built_from_saved_tables(gameset_manager, manager):
+    manager.start_gameset("10", "1", "A")
+    manager.record_game("10", "1", "hanchan", 3, "a:100,b:0,c:-100", "tenhou", "A")
+    manager.start_gameset("10", "1", "B")
+    manager.record_game("10", "1", "hanchan", 3, "a:5,d:0,e:-5", "tenhou", "B")
+
+    reloaded = gameset_manager()
+    assert reloaded.get_standings("10", "1")[2] == [
+        ("a", 105),
+        ("b", 0),
+        ("d", 0),
+        ("e", -5),
+        ("c", -100),
+    ]
+
+    # アイドル状態の卓を閉じた場合も順位表から外れる
+    closed = reloaded.close_idle_gamesets(0, 1)
+    assert [split_gameset_key(key) for _, key, _ in closed] == [("1", "A")]
+    assert reloaded.get_standings("10", "1")[2] == [
+        ("a", 5),
+        ("d", 0),
+        ("e", -5),
+    ]
+
+
+def test_recording_on_one_table_keeps_other_tables_encoded(
+    monkeypatch, gameset_manager
+):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", "snapshot")
+    manager = gameset_manager()
+    for table in ("A", "B"):
+        manager.start_gameset("10", "1", table)
+        manager.record_game(
+            "10", "1", "hanchan", 3, "a:100,b:0,c:-100", "tenhou", table
+        )
+    channels = manager.current_gamesets["10"]
+    blob = channels._blobs["1#A"]
+
+    # 別の卓の記録や終了では、変更していない卓をエンコードし直さない
+    manager.record_game("10", "1", "hanchan", 3, "a:1,b:0,c:-1", "tenhou", "B")
+    manager.end_gameset("10", "1", "B")
+    assert channels._blobs["1#A"] is blob
+
+    reloaded = gameset_manager()
+    assert reloaded.list_tables("10", "1") == ["A"]
+    assert reloaded.get_current_scores("10", "1", "A")[2] == [
+        ("a", 100),
+        ("b", 0),
+        ("c", -100),
+    ]
+    assert reloaded.current_gamesets["10"]["1#B"]["games"] == []
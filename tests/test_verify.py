@@ -0,0 +1,110 @@
+import json
+
+from app.core import data_manager
+from app.core.scores import parse_scores, validate_scores
+from app.tools import verify
+
+GOOD = {
+    "1": {
+        "10": {
+            "status": "inactive",
+            "games": [
+                {"players_count": 4, "scores": {"a": 30, "b": 10, "c": -10, "d": -30}},
+                {"players_count": 4, "scores": {"a": -5, "b": 5, "c": 0, "d": 0}},
+            ],
+            "members": {"a": 25, "b": 15, "c": -10, "d": -30},
+        }
+    }
+}
+
+
+def write(path, gamesets):
+    with open(path, "w") as f:
+        json.dump(gamesets, f)
+
+
+def test_validate_scores():
+    assert validate_scores({"a": 1, "b": -1}, 2) is None
+    assert "3人分" in validate_scores({"a": 1, "b": -1}, 3)
+    assert "合計: 1" in validate_scores({"a": 1, "b": 0}, 2)
+
+    assert parse_scores("a:1, <@123456789012345678>:-1", 2) == (
+        True,
+        "",
+        {"a": 1, 123456789012345678: -1},
+    )
+    assert parse_scores("a:1, a:-1", 2)[0] is False
+    assert parse_scores("a:1, b", 2)[0] is False
+
+
+def test_verify_reports_and_rebuilds(capsys):
+    broken = json.loads(json.dumps(GOOD))
+    gameset_data = broken["1"]["10"]
+    gameset_data["members"]["a"] = 0
+    gameset_data["games"].append({"players_count": 4, "scores": {"a": 1, "b": 0}})
+    gameset_data["members"]["b"] = 15
+    write("gamesets.20240401000000.json", GOOD)
+    write("gamesets.20240402000000.json", broken)
+    with open("gamesets.20240403000000.json", "w") as f:
+        f.write("{broken")
+    write("gamesets.json", GOOD)
+
+    assert verify.main(["--workers", "1"]) == 1
+    output = capsys.readouterr().out
+    assert "gamesets.20240402000000.json: 1/10 3ゲーム目: 4人分" in output
+    assert "{プレイヤー: (members, ゲームの合計)} = {'a': (0, 26)}" in output
+    assert "gamesets.20240403000000.json: 読み込めません" in output
+    assert "gamesets.20240401000000.json" not in output
+    assert "3件のアーカイブと現在の状態を検証しました (3ゲームセット, 7ゲーム" in output
+
+    # --rebuild で members の合計を修正する。条件違反と読み込めないファイルは残る
+    assert verify.main(["--rebuild", "--workers", "2"]) == 1
+    rebuilt = data_manager.load_archive("gamesets.20240402000000.json")
+    assert rebuilt["1"]["10"]["members"] == {"a": 26, "b": 15, "c": -10, "d": -30}
+    capsys.readouterr()
+    verify.main(["--workers", "2"])
+    assert "合計の不一致 0件" in capsys.readouterr().out
+
+
+def test_verify_clean_data_and_seasons(capsys):
+    write("gamesets.20240401000000.json", GOOD)
+    data_manager.save_seasons(
+        {"1": {"4月": {"start": "2024-04-01", "end": "2024-04-30", "standings": {}}}}
+    )
+    assert verify.main([]) == 0
+
+    assert verify.main(["--rebuild"]) == 0
+    assert "シーズン「4月」(1) の順位表を作り直しました" in capsys.readouterr().out
+    standings = data_manager.load_seasons()["1"]["4月"]["standings"]
+    assert standings["a"] == {"points": 25, "games": 2, "placements": [1, 0, 0, 1]}
+
+
+def test_rebuild_seasons_uses_registered_members():
+    # 名前で記録された古いアーカイブと、ユーザーIDで記録された新しいアーカイブ
+    write("gamesets.20240401000000.json", GOOD)
+    migrated = json.loads(json.dumps(GOOD).replace('"a"', '"123456789012345678"'))
+    write("gamesets.20240402000000.json", migrated)
+    data_manager.save_seasons(
+        {"1": {"4月": {"start": "2024-04-01", "end": "2024-04-30", "standings": {}}}}
+    )
+    data_manager.save_members({"1": {"a": 123456789012345678}})
+
+    assert verify.main(["--rebuild", "--workers", "1"]) == 0
+    standings = data_manager.load_seasons()["1"]["4月"]["standings"]
+    assert "a" not in standings
+    assert standings["123456789012345678"]["games"] == 4
+
+
+def test_rebuild_live_snapshot(monkeypatch):
+    monkeypatch.setattr(data_manager, "STORAGE_FORMAT", "snapshot")
+    broken = json.loads(json.dumps(GOOD))
+    broken["1"]["10"]["members"]["a"] = 0
+    broken["1"]["11"] = GOOD["1"]["10"]
+    data_manager.save_gamesets(broken)
+
+    # スナップショットから読み込んだ場合も、修正したゲームセットを書き出す
+    assert verify.verify_live(rebuild=True).rebuilt
+    assert dict(data_manager.load_gamesets()["1"]) == {
+        "10": GOOD["1"]["10"],
+        "11": GOOD["1"]["10"],
+    }